@@ -1,9 +1,19 @@
 #!/usr/bin/env python
 
+import os
 import sys
-from itertools import zip_longest
+import csv
+import json
+from collections import deque
+from io import StringIO
+from itertools import islice, zip_longest
 
-from .currency_converter import CurrencyConverter, CURRENCY_FILE, parse_date
+from .currency_converter import (
+    CurrencyConverter,
+    CURRENCY_FILE,
+    CACHE_DIR_ENV,
+    parse_date,
+)
 from ._version import __version__
 
 
@@ -19,7 +29,182 @@ def grouper(iterable, n, fillvalue=None):
     return list(zip_longest(*[iter(iterable)] * n, fillvalue=fillvalue))
 
 
+FIELDS = ("amount", "currency", "to", "date")
+
+
+def convert_columns(converter, columns, new_currency="EUR", date=None):
+    """Convert the ``amount`` column from the ``currency`` column.
+
+    The ``to`` and ``date`` columns are optional, and their empty values
+    default to ``new_currency`` and ``date``.
+
+    :return: The converted amounts, None for rows that failed.
+
+    >>> c = CurrencyConverter()
+    >>> convert_columns(c, {'amount': ['100', '100'], 'currency': ['EUR', 'AAA'],
+    ...                     'date': ['2013-03-21', '']}, 'USD')
+    [129.1..., None]
+    """
+    amounts = columns["amount"]
+    new_currencies = columns.get("to")
+    if new_currencies is None:
+        new_currencies = new_currency
+    else:
+        new_currencies = [currency or new_currency for currency in new_currencies]
+
+    failed = None
+    dates = columns.get("date")
+    if dates is None:
+        dates = date
+    else:
+        failed = bytearray(len(amounts))
+        dates = list(dates)
+        for i, day in enumerate(dates):
+            if not day:
+                dates[i] = date
+                continue
+            try:
+                dates[i] = parse_date(day)
+            except (TypeError, ValueError):
+                dates[i] = None
+                failed[i] = 1
+
+    values, errors = converter.convert_many(
+        amounts, columns["currency"], new_currencies, dates
+    )
+    if failed is not None:
+        errors = [error or fail for error, fail in zip(errors, failed)]
+    return [None if error else value for value, error in zip(values, errors)]
+
+
+def convert_lines(converter, lines, fmt="csv", header=None, **kwargs):
+    """Convert a chunk of lines, CSV lines with the fields of ``header``, or
+    JSON objects.
+
+    :param kwargs: The ``new_currency`` and ``date`` of :func:`convert_columns`.
+    :return: The lines with a ``new_amount`` field, empty (or null) for rows
+        that could not be converted, as a string.
+    """
+    output = StringIO()
+    if fmt == "csv":
+        rows = list(csv.reader(lines))
+        for row in rows:
+            if len(row) < len(header):
+                row.extend([""] * (len(header) - len(row)))
+        columns = {
+            name: [row[i] for row in rows]
+            for i, name in enumerate(header)
+            if name in FIELDS
+        }
+        values = convert_columns(converter, columns, **kwargs)
+        for row, value in zip(rows, values):
+            row.append("" if value is None else value)
+        csv.writer(output, lineterminator="\n").writerows(rows)
+    else:
+        rows = [json.loads(line) for line in lines if line.strip()]
+        columns = {name: [row.get(name) for row in rows] for name in FIELDS}
+        values = convert_columns(converter, columns, **kwargs)
+        for row, value in zip(rows, values):
+            row["new_amount"] = value
+            output.write(json.dumps(row, default=str) + "\n")
+    return output.getvalue()
+
+
+def read_chunks(lines, size, quoted=False):
+    """Read lines in chunks of about ``size`` lines.
+
+    With ``quoted``, chunks are extended until their double quotes are
+    balanced, so that quoted CSV fields spanning several lines are not split.
+    """
+    lines = iter(lines)
+    while chunk := list(islice(lines, size)):
+        if quoted:
+            quotes = sum(line.count('"') for line in chunk)
+            while quotes % 2:
+                line = next(lines, None)
+                if line is None:
+                    break
+                chunk.append(line)
+                quotes += line.count('"')
+        yield chunk
+
+
+_worker_converter = None
+
+
+def _init_worker(converter):
+    global _worker_converter
+    _worker_converter = converter
+
+
+def _convert_lines_in_worker(lines, fmt, header, kwargs):
+    return convert_lines(_worker_converter, lines, fmt, header, **kwargs)
+
+
+def convert_stream(
+    converter,
+    source,
+    output,
+    fmt="csv",
+    new_currency="EUR",
+    date=None,
+    chunk_size=10000,
+    jobs=1,
+):
+    """Convert the rows of ``source`` and write them to ``output``.
+
+    Rows are CSV lines with a header, or JSON objects, one per line. They
+    are read and converted in chunks, so memory use does not depend on the
+    size of the input. With several jobs, chunks are parsed, converted and
+    formatted by worker processes sharing the rates of ``converter``, then
+    written in order.
+
+    Raises ValueError if the CSV header has no ``amount`` or ``currency``
+    field, before converting any row.
+    """
+    header = None
+    if fmt == "csv":
+        header_line = next(source, None)
+        if header_line is None:
+            return
+        header = next(csv.reader([header_line]))
+        missing = [name for name in ("amount", "currency") if name not in header]
+        if missing:
+            raise ValueError(f"the CSV header has no {' nor '.join(missing)} field")
+        csv.writer(output, lineterminator="\n").writerow(header + ["new_amount"])
+
+    kwargs = {"new_currency": new_currency, "date": date}
+    chunks = read_chunks(source, chunk_size, quoted=fmt == "csv")
+
+    if jobs <= 1:
+        for lines in chunks:
+            output.write(convert_lines(converter, lines, fmt, header, **kwargs))
+        return
+
+    from concurrent.futures import ProcessPoolExecutor
+
+    if converter.cast is float and not converter.sparse:
+        converter.share()  # workers memory-map the rates, see attach
+    pending = deque()
+    with ProcessPoolExecutor(
+        jobs, initializer=_init_worker, initargs=(converter,)
+    ) as executor:
+        for lines in chunks:
+            pending.append(
+                executor.submit(_convert_lines_in_worker, lines, fmt, header, kwargs)
+            )
+            if len(pending) > 2 * jobs:  # bound the chunks in flight
+                output.write(pending.popleft().result())
+        while pending:
+            output.write(pending.popleft().result())
+
+
 def main():
+    if sys.argv[1:2] == ["serve"]:
+        from .server import main as serve
+
+        return serve(sys.argv[2:])
+
     import argparse
 
     parser = argparse.ArgumentParser(prog="currency_converter")
@@ -28,8 +213,8 @@ def main():
         action="version",
         version=f"%(prog)s, version {__version__}",
     )
-    parser.add_argument("amount", type=float)
-    parser.add_argument("currency")
+    parser.add_argument("amount", type=float, nargs="?")
+    parser.add_argument("currency", nargs="?")
 
     parser.add_argument(
         "-t",
@@ -62,6 +247,24 @@ def main():
         action="store_true",
     )
 
+    parser.add_argument(
+        "--exact",
+        help="store rates as fixed-point integers, and round conversions once",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--sparse",
+        help="only store the available rates, and compute missing ones at lookup",
+        action="store_true",
+    )
+
+    parser.add_argument(
+        "--currencies",
+        help="only load the rates of these comma-separated currencies",
+        type=lambda value: value.split(","),
+    )
+
     parser.add_argument(
         "-f",
         "--file",
@@ -69,17 +272,85 @@ def main():
         default=CURRENCY_FILE,
     )
 
+    parser.add_argument(
+        "--cache-dir",
+        help=(
+            "keep a binary cache of the parsed currency file in this directory, "
+            f"default is ${CACHE_DIR_ENV} if set"
+        ),
+        default=os.environ.get(CACHE_DIR_ENV),
+    )
+
+    parser.add_argument(
+        "--batch",
+        help=(
+            "convert the rows of FILE, or of stdin if FILE is omitted or -, and "
+            "write them to stdout with a new_amount field; rows have an amount, "
+            "a currency, and optionally a date and a 'to' currency"
+        ),
+        nargs="?",
+        const="-",
+        metavar="FILE",
+    )
+
+    parser.add_argument(
+        "--format",
+        help="format of the batch rows, default is jsonl for .jsonl files, else csv",
+        choices=["csv", "jsonl"],
+    )
+
+    parser.add_argument(
+        "--chunk-size",
+        help="number of batch rows converted at once, default is %(default)s",
+        type=int,
+        default=10000,
+    )
+
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        help="number of processes converting batch rows, default is %(default)s",
+        type=int,
+        default=1,
+    )
+
     args = parser.parse_args()
+    if args.batch is None and args.currency is None:
+        parser.error("the following arguments are required: amount, currency")
 
     c = CurrencyConverter(
         currency_file=args.file,
         fallback_on_wrong_date=True,
         fallback_on_missing_rate=True,
         decimal=args.decimal,
+        exact=args.exact,
+        sparse=args.sparse,
+        currencies=args.currencies,
         verbose=args.verbose > 1,
+        cache_dir=args.cache_dir,
     )
     currencies = sorted(c.currencies)
 
+    if args.batch is not None:
+        if args.to not in c.currencies:
+            print(rf'/!\ "{args.to}" is not in available currencies', file=sys.stderr)
+            return 1
+        date = None if args.date is None else parse_date(args.date)
+        fmt = args.format
+        if fmt is None:
+            fmt = "jsonl" if args.batch.endswith((".jsonl", ".ndjson")) else "csv"
+        options = fmt, args.to, date, args.chunk_size, args.jobs
+        try:
+            if args.batch == "-":
+                convert_stream(c, sys.stdin, sys.stdout, *options)
+            else:
+                with open(args.batch, newline="", encoding="utf-8") as source:
+                    convert_stream(c, source, sys.stdout, *options)
+        except ValueError as e:
+            print(rf"/!\ {e}", file=sys.stderr)
+            return 1
+        return 0
+
     if args.verbose:
         print(f"{len(currencies)} available currencies:")
         for group in grouper(currencies, 10, fillvalue=""):
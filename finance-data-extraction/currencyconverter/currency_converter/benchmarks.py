@@ -0,0 +1,415 @@
+#!/usr/bin/env python
+"""
+Benchmarks of the loading, lookup and batch conversion speed of the converter.
+
+Run them with ``python -m currency_converter.benchmarks``. They run on the
+bundled ECB file, and on a synthetic history with more days and currencies.
+Results are written as JSON with ``--output``, and compared to the results of
+an earlier run with ``--baseline``, to flag regressions::
+
+    python -m currency_converter.benchmarks -o baseline.json
+    python -m currency_converter.benchmarks --baseline baseline.json
+
+Times are the best of ``--repeat`` runs, as other processes only slow them.
+"""
+
+import gc
+import io
+import os
+import sys
+import json
+import random
+import platform
+import datetime as dt
+import tempfile
+import tracemalloc
+from math import exp
+from time import perf_counter
+from zipfile import ZipFile, ZIP_DEFLATED
+
+from . import currency_converter as cc
+from .currency_converter import CurrencyConverter, CURRENCY_FILE, FALLBACK_METHODS
+from .__main__ import convert_stream
+from ._version import __version__
+
+RESULTS_VERSION = 1
+DEFAULT_THRESHOLD = 0.25
+
+MEMORY_MODES = {
+    "float": {"fallback_on_missing_rate": True},
+    "decimal": {"fallback_on_missing_rate": True, "decimal": True},
+    "exact": {"fallback_on_missing_rate": True, "exact": True},
+    "sparse": {"fallback_on_missing_rate": True, "sparse": True},
+}
+
+# Units where a larger value is better, the smaller is better for the others
+HIGHER_IS_BETTER = {"rows/s"}
+
+
+def synthetic_history(years=50, currencies=60, seed=0):
+    """Lines of a rates file in the ECB format, with random rates.
+
+    Rates follow a random walk with 4 decimals, are published on weekdays
+    until today, and about 1% of them are missing.
+
+    :return: A list of lines, most recent date first like the ECB file.
+    """
+    rng = random.Random(seed)
+    codes = [f"X{chr(65 + i // 26 % 26)}{chr(65 + i % 26)}" for i in range(currencies)]
+    rates = [10 ** rng.uniform(-1, 3) for _ in codes]
+
+    lines = [f"Date,{','.join(codes)},"]
+    day = dt.date.today()
+    for _ in range(round(years * 365.25)):
+        day -= dt.timedelta(days=1)
+        if day.weekday() >= 5:
+            continue
+        cells = []
+        for i, rate in enumerate(rates):
+            rates[i] = rate = rate * exp(rng.gauss(0, 0.005))
+            cells.append("N/A" if rng.random() < 0.01 else f"{rate:.4f}")
+        lines.append(f"{day},{','.join(cells)},")
+    return lines
+
+
+def write_history(lines, directory, name):
+    """Write lines as a CSV file and as a zip file like the ECB one.
+
+    :return: The paths of the CSV and zip files.
+    """
+    csv_path = os.path.join(directory, f"{name}.csv")
+    zip_path = os.path.join(directory, f"{name}.zip")
+    content = "\n".join(lines) + "\n"
+    with open(csv_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    with ZipFile(zip_path, "w", ZIP_DEFLATED) as zip_file:
+        zip_file.writestr(f"{name}.csv", content)
+    return csv_path, zip_path
+
+
+def best_of(func, repeat):
+    """The shortest time of ``repeat`` calls of ``func``, in seconds."""
+    times = []
+    gc_enabled = gc.isenabled()
+    try:
+        for _ in range(repeat):
+            gc.collect()
+            gc.disable()
+            start = perf_counter()
+            func()
+            times.append(perf_counter() - start)
+            gc.enable()
+    finally:
+        if gc_enabled:
+            gc.enable()
+    return min(times)
+
+
+def cold_load(currency_file, **kwargs):
+    """Load a converter, without reusing the rates of other converters."""
+    cc._shared_tables.clear()
+    return CurrencyConverter(currency_file, **kwargs)
+
+
+def fill_columns(converter):
+    """Fill the missing rates of all currencies, as lookups would."""
+    view = converter._view
+    if view.sparse:  # missing rates are computed at each lookup
+        return converter
+    for currency in view.table.rates:
+        view.column(currency)
+    return converter
+
+
+def percentile(sorted_values, fraction):
+    index = min(len(sorted_values) - 1, round(fraction * (len(sorted_values) - 1)))
+    return sorted_values[index]
+
+
+def random_rows(converter, n, rng):
+    """Random amounts, currencies and dates within the bounds of the rates."""
+    currencies = sorted(converter.currencies)
+    first = min(bound.first_date for bound in converter.bounds.values()).toordinal()
+    last = max(bound.last_date for bound in converter.bounds.values()).toordinal()
+    return (
+        [round(rng.uniform(1, 1000), 2) for _ in range(n)],
+        [rng.choice(currencies) for _ in range(n)],
+        [rng.choice(currencies) for _ in range(n)],
+        [dt.date.fromordinal(rng.randint(first, last)) for _ in range(n)],
+    )
+
+
+def bench_loads(results, name, csv_path, zip_path, repeat):
+    results[f"{name}.load.zip"] = best_of(lambda: cold_load(zip_path), repeat), "s"
+    results[f"{name}.load.csv"] = best_of(lambda: cold_load(csv_path), repeat), "s"
+    for method in FALLBACK_METHODS:
+        kwargs = {
+            "fallback_on_missing_rate": True,
+            "fallback_on_missing_rate_method": method,
+        }
+        elapsed = best_of(
+            lambda kwargs=kwargs: fill_columns(cold_load(zip_path, **kwargs)), repeat
+        )
+        results[f"{name}.load.{method}"] = elapsed, "s"
+    kwargs = {"fallback_on_missing_rate": True, "sparse": True}
+    elapsed = best_of(lambda: cold_load(zip_path, **kwargs), repeat)
+    results[f"{name}.load.sparse"] = elapsed, "s"
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cold_load(zip_path, cache_dir=cache_dir)
+        elapsed = best_of(lambda: cold_load(zip_path, cache_dir=cache_dir), repeat)
+        results[f"{name}.load.cache"] = elapsed, "s"
+        # The mapped cache file must be closed before it is removed
+        cc._shared_tables.clear()
+        gc.collect()
+
+
+def bench_lookups(results, name, zip_path, repeat, rows, calls):
+    c = fill_columns(
+        cold_load(zip_path, fallback_on_missing_rate=True, fallback_on_wrong_date=True)
+    )
+    rng = random.Random(0)
+
+    timings = []
+    convert = c.convert
+    for args in zip(*random_rows(c, calls, rng)):
+        start = perf_counter()
+        convert(*args)
+        timings.append(perf_counter() - start)
+    timings.sort()
+    for fraction in 0.5, 0.9, 0.99:
+        value = percentile(timings, fraction) * 1e6
+        results[f"{name}.convert.p{round(fraction * 100)}"] = value, "us"
+
+    amounts, currencies, new_currencies, dates = random_rows(c, rows, rng)
+    pair = c.pair(currencies[0], new_currencies[0])
+    elapsed = best_of(lambda: list(map(pair, amounts, dates)), repeat)
+    results[f"{name}.pair"] = rows / elapsed, "rows/s"
+
+    elapsed = best_of(
+        lambda: c.convert_many(amounts, currencies, new_currencies, dates), repeat
+    )
+    results[f"{name}.convert_many"] = rows / elapsed, "rows/s"
+
+    csv_rows = zip(amounts, currencies, new_currencies, dates)
+    source = "amount,currency,to,date\n" + "".join(
+        f"{amount},{currency},{new_currency},{date}\n"
+        for amount, currency, new_currency, date in csv_rows
+    )
+    elapsed = best_of(
+        lambda: convert_stream(c, io.StringIO(source), io.StringIO()), repeat
+    )
+    results[f"{name}.convert_stream"] = rows / elapsed, "rows/s"
+
+    # Distinct dates, so that no matrix comes from the cache
+    dates = iter(random_rows(c, repeat, rng)[3])
+    elapsed = best_of(lambda: c.cross_rates(next(dates)), repeat)
+    results[f"{name}.cross_rates"] = elapsed, "s"
+
+
+def bench_memory(results, name, zip_path):
+    """Memory kept by a converter with all its columns filled, per mode.
+
+    The rates table is shared by the converters loading the same data, the
+    filled columns are the memory each converter adds on top of it.
+    """
+    for mode, options in MEMORY_MODES.items():
+        cc._shared_tables.clear()
+        gc.collect()
+        tracemalloc.start()
+        try:
+            c = CurrencyConverter(zip_path, **options)
+            table = tracemalloc.get_traced_memory()[0]
+            fill_columns(c)
+            size, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        del c
+        results[f"{name}.memory.{mode}"] = size, "B"
+        results[f"{name}.memory.{mode}.table"] = table, "B"
+        results[f"{name}.memory.{mode}.instance"] = size - table, "B"
+        results[f"{name}.memory.{mode}.peak"] = peak, "B"
+
+
+def run_benchmarks(
+    repeat=5, rows=100_000, calls=10_000, years=50, currencies=60, bundled=True
+):
+    """Run all the benchmarks.
+
+    :param int repeat: How many times each timed benchmark is run.
+    :param int rows: The number of rows of the batch conversions.
+    :param int calls: The number of timed single conversions.
+    :param int years: The length of the synthetic history, 0 to skip it.
+    :param int currencies: The number of currencies of the synthetic history.
+    :param bool bundled: Set to False to skip the bundled ECB file.
+
+    :return: A dict of ``name: (value, unit)``.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        datasets = []
+        if bundled:
+            with ZipFile(CURRENCY_FILE) as zip_file:
+                (member,) = zip_file.namelist()
+                lines = zip_file.read(member).decode("utf-8").splitlines()
+            csv_path, _ = write_history(lines, directory, "ecb")
+            datasets.append(("ecb", csv_path, CURRENCY_FILE))
+        if years:
+            lines = synthetic_history(years, currencies)
+            datasets.append(("synthetic", *write_history(lines, directory, "synth")))
+
+        for name, csv_path, zip_path in datasets:
+            bench_loads(results, name, csv_path, zip_path, repeat)
+            bench_lookups(results, name, zip_path, repeat, rows, calls)
+            bench_memory(results, name, zip_path)
+    cc._shared_tables.clear()
+    return results
+
+
+def to_json(results):
+    """The results, and what they were measured with, as a JSON document."""
+    return {
+        "version": RESULTS_VERSION,
+        "currency_converter": __version__,
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "machine": platform.machine(),
+        "date": dt.datetime.now().isoformat(timespec="seconds"),
+        "results": {
+            name: {"value": value, "unit": unit}
+            for name, (value, unit) in results.items()
+        },
+    }
+
+
+def from_json(document):
+    """The results of a JSON document written by :func:`to_json`."""
+    if document.get("version") != RESULTS_VERSION:
+        raise ValueError(f"Unsupported results version {document.get('version')!r}")
+    return {
+        name: (result["value"], result["unit"])
+        for name, result in document["results"].items()
+    }
+
+
+def compare(results, baseline, threshold=DEFAULT_THRESHOLD):
+    """Compare results to a baseline.
+
+    :param float threshold: The relative change of a result considered as a
+        regression, when it is worse than its baseline.
+
+    :return: A list of ``(name, baseline, value, change, regressed)``, where
+        ``change`` is the relative change from the baseline, positive if
+        the value got worse. Results missing from either side are skipped.
+
+    >>> compare({'load': (1.5, 's'), 'many': (90, 'rows/s')},
+    ...         {'load': (1.0, 's'), 'many': (100, 'rows/s')})
+    [('load', 1.0, 1.5, 0.5, True), ('many', 100, 90, 0.1, False)]
+    """
+    comparisons = []
+    for name, (value, unit) in results.items():
+        if name not in baseline:
+            continue
+        base, base_unit = baseline[name]
+        if base_unit != unit or not base:
+            continue
+        change = (value - base) / base
+        if unit in HIGHER_IS_BETTER:
+            change = -change
+        comparisons.append((name, base, value, change, change > threshold))
+    return comparisons
+
+
+def format_value(value, unit):
+    if unit == "B":
+        return f"{value / 2**20:,.2f} MiB"
+    if unit == "s":
+        return f"{value * 1e3:,.2f} ms"
+    return f"{value:,.2f} {unit}"
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="python -m currency_converter.benchmarks")
+    parser.add_argument("-o", "--output", help="write the results as JSON to OUTPUT")
+    parser.add_argument(
+        "--baseline",
+        help="compare the results to the JSON results of an earlier run",
+    )
+    parser.add_argument(
+        "--threshold",
+        help="relative slowdown flagged as a regression, default is %(default)s",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+    )
+    parser.add_argument(
+        "--repeat",
+        help="runs of each timed benchmark, default is %(default)s",
+        type=int,
+        default=5,
+    )
+    parser.add_argument(
+        "--rows",
+        help="rows of the batch conversions, default is %(default)s",
+        type=int,
+        default=100_000,
+    )
+    parser.add_argument(
+        "--calls",
+        help="timed single conversions, default is %(default)s",
+        type=int,
+        default=10_000,
+    )
+    parser.add_argument(
+        "--years",
+        help="years of the synthetic history, 0 to skip it, default is %(default)s",
+        type=int,
+        default=50,
+    )
+    parser.add_argument(
+        "--currencies",
+        help="currencies of the synthetic history, default is %(default)s",
+        type=int,
+        default=60,
+    )
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = from_json(json.load(f))
+
+    results = run_benchmarks(
+        args.repeat, args.rows, args.calls, args.years, args.currencies
+    )
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(to_json(results), f, indent=2)
+            f.write("\n")
+
+    if baseline is None:
+        for name, (value, unit) in results.items():
+            print(f"{name:<40} {format_value(value, unit):>20}")
+        return 0
+
+    regressions = 0
+    for name, base, value, change, regressed in compare(
+        results, baseline, args.threshold
+    ):
+        unit = results[name][1]
+        flag = "REGRESSION" if regressed else ""
+        print(
+            f"{name:<40} {format_value(base, unit):>20} {format_value(value, unit):>20}"
+            f" {change:+8.1%} {flag}"
+        )
+        regressions += regressed
+    if regressions:
+        print(
+            f"{regressions} regression(s) above {args.threshold:.0%}", file=sys.stderr
+        )
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
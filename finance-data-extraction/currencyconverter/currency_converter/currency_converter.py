@@ -1,27 +1,64 @@
 #!/usr/bin/env python
 
+import os
 import os.path as op
-from functools import wraps
+import sys
+import re
+import operator
+import json
+import mmap
+import hashlib
+import shutil
+import tempfile
+import decimal
+import threading
+import weakref
+from contextlib import contextmanager, nullcontext
+from functools import partial, wraps
+from itertools import accumulate, chain, compress, islice
 import datetime
 from datetime import timedelta
-from collections import defaultdict, namedtuple
+from array import array
+from bisect import bisect_right
+from collections import Counter, deque, namedtuple, OrderedDict
 from zipfile import ZipFile
-from io import BytesIO
-from decimal import Decimal
+from io import BytesIO, TextIOWrapper
+from decimal import Decimal, Context, ROUND_HALF_EVEN
+from time import perf_counter
 from urllib.request import urlopen
 
+NAN = float("nan")
+INF = float("inf")
+
 _DIRNAME = op.realpath(op.dirname(__file__))
 CURRENCY_FILE = op.join(_DIRNAME, "eurofxref-hist.zip")
 SINGLE_DAY_CURRENCY_FILE = op.join(_DIRNAME, "eurofxref.csv")
 ECB_URL = "https://www.ecb.europa.eu/stats/eurofxref/eurofxref-hist.zip"
 SINGLE_DAY_ECB_URL = "https://www.ecb.europa.eu/stats/eurofxref/eurofxref.zip"
+CACHE_DIR_ENV = "CURRENCY_CONVERTER_CACHE_DIR"
 
 Bounds = namedtuple("Bounds", "first_date last_date")
+CrossRates = namedtuple("CrossRates", "currencies rates")
+Timing = namedtuple("Timing", "count total max")
+
+FALLBACK_METHODS = ("linear_interpolation", "last_known", "nearest")
+
+# With exact=True, rates are stored as integers in units of 10 ** -FIXED_POINT_PLACES
+FIXED_POINT_PLACES = 6
+_FIXED_POINT_SCALE = 10**FIXED_POINT_PLACES
+_MORE_DECIMALS = re.compile(rf"\.\d{{{FIXED_POINT_PLACES + 1}}}")
+# Products of decimals are exact in this context
+_EXACT_CONTEXT = Context(
+    prec=decimal.MAX_PREC, Emax=decimal.MAX_EMAX, Emin=decimal.MIN_EMIN
+)
 
 __all__ = [
     "CurrencyConverter",
     "S3CurrencyConverter",
+    "RefreshingCurrencyConverter",
+    "FederatedCurrencyConverter",
     "RateNotFoundError",
+    "ConverterStats",
     "ECB_URL",
     "SINGLE_DAY_ECB_URL",
     "CURRENCY_FILE",
@@ -29,19 +66,176 @@ __all__ = [
 ]
 
 
-def memoize(function):
-    memo = {}
+CacheInfo = namedtuple("CacheInfo", "hits misses maxsize currsize")
+
+_missing = object()
+
+
+class LRUCache:
+    """
+    Cache keeping at most ``maxsize`` items, evicting the least recently
+    used ones first. ``hits`` and ``misses`` count the lookups.
+
+    >>> cache = LRUCache(maxsize=2)
+    >>> cache['a'], cache['b'], cache['c'] = 1, 2, 3
+    >>> cache.get('a'), cache.get('c')
+    (None, 3)
+    >>> cache.info()
+    CacheInfo(hits=1, misses=1, maxsize=2, currsize=2)
+    """
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __setitem__(self, key, value):
+        data = self._data
+        data[key] = value
+        data.move_to_end(key)
+        while len(data) > self.maxsize:
+            try:
+                data.popitem(last=False)
+            except KeyError:  # emptied by another thread
+                break
+
+    def get(self, key, default=None):
+        try:
+            value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        try:
+            self._data.move_to_end(key)
+        except KeyError:  # evicted by another thread
+            pass
+        self.hits += 1
+        return value
+
+    def clear(self):
+        """Remove all items and reset the counters."""
+        self._data.clear()
+        self.hits = self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+
+class ConverterStats:
+    """
+    Counters and timings of a converter, collected with ``collect_stats``.
+
+    Counters are numbers of events, such as calls or fallbacks, and timings
+    are durations in seconds, such as the load phases. Hooks are called with
+    the name and value of each event as it happens, to forward them to a
+    metrics system.
+
+    >>> stats = ConverterStats()
+    >>> stats.add_hook(lambda name, value: print(name, value))
+    >>> stats.count('convert')
+    convert 1
+    >>> stats.snapshot()['counters']
+    {'convert': 1}
+    """
+
+    def __init__(self):
+        self.counters = Counter()
+        self.timings = {}
+        self.hooks = []
+        self._lock = threading.Lock()
+
+    def __reduce__(self):
+        return type(self), ()  # copies start afresh, without the hooks
+
+    def add_hook(self, hook):
+        """Call ``hook(name, value)`` at each event.
+
+        The value is the increment of a counter, or the duration of a timing.
+        Hooks are called in the thread of the event, and should be quick.
+        """
+        self.hooks.append(hook)
+
+    def remove_hook(self, hook):
+        self.hooks.remove(hook)
+
+    def count(self, name, n=1):
+        with self._lock:
+            self.counters[name] += n
+        for hook in self.hooks:
+            hook(name, n)
+
+    def record(self, name, seconds):
+        with self._lock:
+            count, total, longest = self.timings.get(name, (0, 0.0, 0.0))
+            self.timings[name] = Timing(
+                count + 1, total + seconds, max(longest, seconds)
+            )
+        for hook in self.hooks:
+            hook(name, seconds)
+
+    @contextmanager
+    def timer(self, name):
+        """Record the duration of a block, if it does not raise."""
+        start = perf_counter()
+        yield
+        self.record(name, perf_counter() - start)
+
+    def snapshot(self):
+        """Returns a copy of the counters and timings.
+
+        :return: A dict with ``counters``, a dict of names to numbers, and
+            ``timings``, a dict of names to ``Timing(count, total, max)``.
+        """
+        with self._lock:
+            return {"counters": dict(self.counters), "timings": dict(self.timings)}
+
+    def clear(self):
+        """Reset the counters and timings, the hooks are kept."""
+        with self._lock:
+            self.counters.clear()
+            self.timings.clear()
+
+
+def _counting(method, stats, name):
+    """Wrap a method to count its calls."""
+
+    @wraps(method)
+    def wrapper(*args, **kwargs):
+        stats.count(name)
+        return method(*args, **kwargs)
+
+    return wrapper
+
+
+def memoize(function=None, maxsize=1024):
+    """Cache the results of a function in a :class:`LRUCache`.
+
+    The wrapped function has ``cache_info()`` and ``cache_clear()``
+    methods, like with ``functools.lru_cache``.
+    """
+    if function is None:
+        return lambda function: memoize(function, maxsize)
+
+    cache = LRUCache(maxsize)
 
     @wraps(function)
     def wrapper(*args):
-        if args not in memo:
-            memo[args] = function(*args)
-        return memo[args]
-
+        value = cache.get(args, _missing)
+        if value is _missing:
+            value = cache[args] = function(*args)
+        return value
+
+    wrapper.cache = cache
+    wrapper.cache_info = cache.info
+    wrapper.cache_clear = cache.clear
     return wrapper
 
 
-@memoize
+@memoize(maxsize=32)
 def list_dates_between(first_date, last_date):
     """Returns all dates from first to last included."""
     return [
@@ -49,8 +243,7 @@ def list_dates_between(first_date, last_date):
     ]
 
 
-@memoize
-def parse_date(s):
+def _parse_date(s):
     """Fast %Y-%m-%d parsing."""
     try:
         return datetime.date(int(s[:4]), int(s[5:7]), int(s[8:10]))
@@ -58,10 +251,349 @@ def parse_date(s):
         return datetime.datetime.strptime(s, "%d %B %Y").date()
 
 
+# Dates given by users are often the same, the dates of a file are parsed
+# once each with the non cached version
+parse_date = memoize(_parse_date, maxsize=4096)
+
+_UNIX_EPOCH_ORDINAL = datetime.date(1970, 1, 1).toordinal()
+
+
+def to_ordinal(date):
+    """Returns the proleptic Gregorian ordinal of a date.
+
+    Dates are converted once to ordinals when given to a converter, and
+    looked up as integers. Ordinals are returned as they are, so callers
+    converting many times at the same dates can pass ordinals directly.
+
+    :param date: A ``datetime.date`` or ``datetime.datetime`` (including
+        pandas timestamps), a NumPy ``datetime64``, a ``YYYY-MM-DD`` string,
+        or an ordinal.
+
+    >>> to_ordinal(datetime.date(2014, 3, 28))
+    735320
+    >>> to_ordinal('2014-03-28'), to_ordinal(735320)
+    (735320, 735320)
+    """
+    if isinstance(date, int):
+        return date
+    try:
+        return date.toordinal()
+    except AttributeError:
+        pass
+    if isinstance(date, str):
+        return parse_date(date).toordinal()
+    kind = getattr(getattr(date, "dtype", None), "kind", None)
+    if kind == "M":  # NumPy datetime64
+        if date != date:
+            raise ValueError("NaT is not a date")
+        days = date.astype("datetime64[D]").astype("int64")
+        return int(days) + _UNIX_EPOCH_ORDINAL
+    if kind in ("i", "u"):  # NumPy integers
+        return int(date)
+    raise TypeError(f"{date!r} is not a date")
+
+
+def _offset_to_str(view, offset):
+    """Returns the date of an offset for messages, even if it is not valid."""
+    try:
+        return str(view.offset_to_date(offset))
+    except (ValueError, OverflowError):
+        return f"day {view.origin + offset}"
+
+
+def to_fixed_point(rate):
+    """Returns a rate as an integer number of ``10 ** -FIXED_POINT_PLACES``.
+
+    >>> to_fixed_point('1.3758')
+    1375800
+    >>> to_fixed_point('1.23456789')
+    Traceback (most recent call last):
+    ValueError: 1.23456789 has more than 6 decimals
+    """
+    whole, _, fraction = rate.strip().partition(".")
+    if len(fraction) <= FIXED_POINT_PLACES and (fraction.isdigit() or not fraction):
+        return int(whole + fraction.ljust(FIXED_POINT_PLACES, "0"))
+    scaled = Decimal(rate).scaleb(FIXED_POINT_PLACES)
+    if scaled != scaled.to_integral_value():
+        raise ValueError(f"{rate} has more than {FIXED_POINT_PLACES} decimals")
+    return int(scaled)
+
+
+def from_fixed_point(rate):
+    """Returns a rate stored by :func:`to_fixed_point` as a Decimal."""
+    return Decimal(rate).scaleb(-FIXED_POINT_PLACES)
+
+
+def _divide(numerator, denominator, places=None, rounding=ROUND_HALF_EVEN):
+    """Returns ``numerator / denominator`` as a Decimal, rounded only once.
+
+    ``numerator`` and ``denominator`` are integers, or decimals if ``places``
+    is None.
+
+    The quotient is rounded to ``places`` decimals, or to the precision of
+    the current decimal context if None, with the ``rounding`` mode.
+
+    >>> _divide(2, 3, places=2), _divide(-5, 8, places=2), _divide(1, 3)
+    (Decimal('0.67'), Decimal('-0.62'), Decimal('0.3333333333333333333333333333'))
+    """
+    if places is None:
+        context = decimal.getcontext()
+        if context.rounding != rounding:
+            context = context.copy()
+            context.rounding = rounding
+        return context.divide(numerator, denominator)
+
+    # One more digit than needed, and a last digit telling whether the
+    # quotient is exact, are enough to round it like the exact quotient
+    sign = "-" if (numerator < 0) != (denominator < 0) else ""
+    quotient, remainder = divmod(abs(numerator) * 10 ** (places + 1), abs(denominator))
+    digits = str(10 * quotient + bool(remainder))
+    inexact = Decimal(f"{sign}{digits}E{-places - 2}")
+    context = Context(prec=len(digits) + 1, rounding=rounding)
+    return inexact.quantize(Decimal(f"1E{-places}"), context=context)
+
+
+def _new_column(size, cast):
+    """Returns a column of ``size`` missing rates.
+
+    Float rates are stored in a contiguous ``array('d')``, fixed-point rates
+    in an ``array('q')``, other types (such as ``Decimal``) fall back on a
+    list.
+    """
+    if cast is float:
+        return array("d", [NAN]) * size
+    if cast is to_fixed_point:
+        return array("q", [0]) * size
+    return [None] * size
+
+
+def _typecode(column):
+    """Returns the typecode of an array or memoryview column."""
+    return column.typecode if isinstance(column, array) else column.format
+
+
+def _neutral(column, func):
+    """Returns a rate ignored by ``func`` (``min`` or ``max``) for a column."""
+    if isinstance(column, (array, memoryview)) and _typecode(column) == "q":
+        return 2**63 - 1 if func is min else -(2**63)
+    return INF if func is min else -INF
+
+
+def _repeat(column, value, n):
+    """Returns ``n`` times ``value``, as the same kind of sequence as ``column``."""
+    if isinstance(column, array):
+        return array(column.typecode, [value]) * n
+    return [value] * n
+
+
+def _freeze(column):
+    """Returns a read-only version of a column."""
+    if isinstance(column, array):
+        return memoryview(column).toreadonly()
+    return tuple(column)
+
+
+def _like(column, values):
+    """Returns the list ``values`` as the same kind of sequence as ``column``."""
+    if isinstance(column, (array, memoryview)):
+        return array(_typecode(column), values)
+    return values
+
+
+def _empty_like(column, size):
+    """Returns a column of ``size`` missing rates, of the same kind as ``column``."""
+    if isinstance(column, (array, memoryview)):
+        typecode = _typecode(column)
+        return array(typecode, [NAN if typecode == "d" else 0]) * size
+    return [None] * size
+
+
+def _copy_column(column):
+    """Returns a writable copy of a column."""
+    if isinstance(column, memoryview):
+        copy = array(column.format)
+        copy.frombytes(column.cast("B"))
+        return copy
+    return list(column)
+
+
+def _missing_runs(valid, first, last):
+    """Yields (start, end) offsets of consecutive missing rates.
+
+    Only the runs strictly between ``first`` and ``last`` are yielded,
+    so ``start - 1`` and ``end`` are always valid offsets.
+    """
+    start = valid.find(0, first, last)
+    while start != -1:
+        end = valid.find(1, start, last + 1)
+        yield start, end
+        start = valid.find(0, end, last)
+
+
+# Cache files start with this magic string, then the length of a JSON header
+# (origin, size, currencies), then one float64 column per currency, then one
+# byte per day and currency for the validity masks.
+CACHE_MAGIC = b"CCRATES1"
+_CACHE_PREFIX = len(CACHE_MAGIC) + 8
+
+
+def write_cache(cache_file, table):
+    """Atomically write the rate columns and validity masks of a table."""
+    currencies = sorted(table.rates)
+    typecodes = {_typecode(memoryview(column)) for column in table.rates.values()}
+    header = json.dumps(
+        {
+            "origin": table.origin,
+            "size": table.size,
+            "currencies": currencies,
+            "typecode": typecodes.pop() if typecodes else "d",
+        }
+    ).encode()
+    header += b" " * (-(_CACHE_PREFIX + len(header)) % 8)  # align columns
+
+    cache_dir = op.dirname(cache_file) or "."
+    os.makedirs(cache_dir, exist_ok=True)
+    fd, tmp_file = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(CACHE_MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for currency in currencies:
+                f.write(memoryview(table.rates[currency]).cast("B"))
+            for currency in currencies:
+                f.write(table.valid[currency])
+        os.replace(tmp_file, cache_file)
+    except BaseException:
+        os.unlink(tmp_file)
+        raise
+
+
+def read_cache(cache_file):
+    """Memory-map a cache file written by :func:`write_cache`.
+
+    Returns a :class:`RateTable` whose rate columns are read-only
+    memoryviews on the mapped file.
+    """
+    with open(cache_file, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if buf[: len(CACHE_MAGIC)] != CACHE_MAGIC:
+        raise ValueError(f"{cache_file} is not a rates cache file")
+    header_size = int.from_bytes(buf[len(CACHE_MAGIC) : _CACHE_PREFIX], "little")
+    header = json.loads(buf[_CACHE_PREFIX : _CACHE_PREFIX + header_size])
+    origin, size, currencies = header["origin"], header["size"], header["currencies"]
+    typecode = header.get("typecode", "d")
+
+    start = _CACHE_PREFIX + header_size
+    if len(buf) != start + 9 * size * len(currencies):
+        raise ValueError(f"{cache_file} is truncated")
+
+    view = memoryview(buf)
+    rates = {}
+    for currency in currencies:
+        rates[currency] = view[start : start + 8 * size].cast(typecode)
+        start += 8 * size
+    valid = {}
+    for currency in currencies:
+        valid[currency] = bytes(view[start : start + size])
+        start += size
+
+    table = RateTable(origin, size, rates, valid)
+    table.source_file = cache_file
+    return table
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def open_content(currency_file):
+    """Opens a local file, or downloads an URL to a temporary file.
+
+    :return: A binary file, which can be rewound to read it again.
+    """
+    if currency_file.startswith(("http://", "https://")):
+        f = tempfile.TemporaryFile()
+        with urlopen(currency_file) as response:
+            shutil.copyfileobj(response, f)
+        f.seek(0)
+        return f
+    return open(currency_file, "rb")
+
+
+def hash_content(f):
+    """Returns the sha256 of a binary file read by chunks, then rewinds it."""
+    digest = hashlib.sha256()
+    for chunk in iter(partial(f.read, 1 << 20), b""):
+        digest.update(chunk)
+    f.seek(0)
+    return digest
+
+
+def get_lines(content, is_zip):
+    """Returns the lines of a source file content, as bytes or a binary file.
+
+    Lines of a file are decoded as they are read, and zip archives are
+    decompressed as they are read.
+    """
+    if is_zip:
+        return get_lines_from_zip(content)
+    if isinstance(content, bytes):
+        return content.decode("utf-8").splitlines()
+    return _iter_lines(content)
+
+
 def get_lines_from_zip(zip_str):
-    zip_file = ZipFile(BytesIO(zip_str))
-    for name in zip_file.namelist():
-        yield from zip_file.read(name).decode("utf-8").splitlines()
+    if isinstance(zip_str, bytes):
+        zip_str = BytesIO(zip_str)
+    with ZipFile(zip_str) as zip_file:
+        for name in zip_file.namelist():
+            with zip_file.open(name) as f:
+                yield from _iter_lines(f)
+
+
+def _iter_lines(f):
+    """Yields the lines of a binary file, decoded, without their line ending."""
+    for line in TextIOWrapper(f, encoding="utf-8"):
+        yield line.rstrip("\n")
+
+
+def _read_header(lines, currencies=None):
+    """Read the header line of a source file, in the ECB format.
+
+    :param currencies: Only keep the columns of these currencies, default
+        is all of them.
+    :return: The currencies of the kept columns, the selectors of the kept
+        columns among the cells after the date, and the number of splits
+        needed to read them from a line.
+    """
+    header = [c.strip() for c in next(lines).strip().split(",")[1:]]
+    keep = [bool(c) and (currencies is None or c in currencies) for c in header]
+    splits = 1 + max((i + 1 for i, kept in enumerate(keep) if kept), default=0)
+    return list(compress(header, keep)), keep, splits
+
+
+def _check_decimals(cells, line):
+    """Raise ValueError if rates cannot be stored as fixed-point rates."""
+    if _MORE_DECIMALS.search(",".join(cells)):
+        raise ValueError(f"rates have more than {FIXED_POINT_PLACES} decimals: {line}")
+
+
+# Sources with more rows are parsed by chunks, the chunks after the first
+# PARALLEL_THRESHOLD rows in a process pool
+PARSE_CHUNK_SIZE = 20000
+PARALLEL_THRESHOLD = 100000
+
+
+def _parse_chunk(header, lines, na_values, cast, currencies):
+    """Parse a chunk of lines in a worker, returns the table as picklable data."""
+    table = RateTable.from_lines(chain([header], lines), na_values, cast, currencies)
+    rates = {currency: _copy_column(c) for currency, c in table.rates.items()}
+    return table.origin, table.size, rates, table.valid
 
 
 class RateNotFoundError(Exception):
@@ -70,6 +602,880 @@ class RateNotFoundError(Exception):
     pass
 
 
+def _unpickle_table(origin, size, rates, valid):
+    return RateTable(
+        origin, size, {c: _freeze(column) for c, column in rates.items()}, valid
+    )
+
+
+class RateTable:
+    """
+    Immutable history of rates, as parsed from the source data.
+
+    Converters loading the same data with the same ``na_values`` and
+    ``decimal`` options share one table, whatever their fallback options.
+
+    ``rates`` is a dictionary with:
+
+    - currencies as keys
+    - read-only columns of rates as values, indexed by the day offset from
+      ``origin``, the ordinal of the first date of the source data.
+
+    ``valid`` has the same keys, with validity masks as values:
+    ``valid[currency][offset]`` is 1 if the rate is available, 0 otherwise.
+
+    ``spans`` has the same keys, with the offsets of the first and last
+    available rates as values.
+
+    ``source_file`` is the cache file the table is memory-mapped from, if any.
+    Other processes can map the same file with :func:`read_cache`: once
+    ``shared`` by :meth:`share`, tables pickle as the path of this file.
+    Otherwise they pickle by value.
+    """
+
+    def __init__(self, origin, size, rates, valid):
+        self.origin = origin
+        self.size = size
+        self.rates = rates
+        self.valid = valid
+        self.spans = {
+            currency: (mask.find(1), mask.rfind(1)) for currency, mask in valid.items()
+        }
+        self.source_file = None
+        self.shared = False
+
+    def __reduce__(self):
+        if self.shared:
+            return read_cache, (self.source_file,)
+        return _unpickle_table, (
+            self.origin,
+            self.size,
+            {c: _copy_column(column) for c, column in self.rates.items()},
+            self.valid,
+        )
+
+    def share(self):
+        """Make the table available to other processes.
+
+        If the table is not already mapped from a cache file, it is written
+        to a temporary file, in shared memory when available (``/dev/shm``).
+        The temporary file is removed when the table is garbage collected, so
+        the table must be kept alive as long as other processes may map it.
+        From then on, the table pickles as the path of the file.
+
+        :return: The path of a file to use with :func:`read_cache`.
+        """
+        if self.source_file is None:
+            shm_dir = "/dev/shm" if op.isdir("/dev/shm") else None
+            fd, source_file = tempfile.mkstemp(
+                prefix="currency_converter-", suffix=".rates", dir=shm_dir
+            )
+            os.close(fd)
+            remove = weakref.finalize(self, _remove_file, source_file)
+            try:
+                write_cache(source_file, self)
+            except BaseException:
+                remove()
+                raise
+            self.source_file = source_file
+        self.shared = True
+        return self.source_file
+
+    @classmethod
+    def from_lines(
+        cls, lines, na_values=frozenset(["", "N/A"]), cast=float, currencies=None
+    ):
+        """Parse the lines of a source file, in the ECB format.
+
+        :param currencies: Only parse the columns of these currencies, the
+            other columns are not even split from the lines. Default is all.
+        """
+        lines = iter(lines)
+        header, keep, splits = _read_header(lines, currencies)
+
+        # Fixed-point rates are parsed as floats then scaled, which is exact
+        # for rates of at most FIXED_POINT_PLACES decimals, and faster than
+        # parsing them as integers
+        fixed_point = cast is to_fixed_point
+
+        # Rows are stored as they are read, so that the lines are never all
+        # in memory and can come from a stream. As the dates are not known in
+        # advance, columns grow from the date of the first row, on two sides:
+        # the later dates, and the earlier dates in reverse order.
+        sides = {}
+        for currency in header:
+            if currency not in sides:
+                sides[currency] = [
+                    (_new_column(0, cast), bytearray()) for _ in range(2)
+                ]
+        later = [sides[c][0] for c in header]
+        earlier = [sides[c][1] for c in header]
+        capacity = [0, 0]
+        anchor = first = last = None
+
+        for line in lines:
+            cells = line.strip().split(",", splits)
+            ordinal = _parse_date(cells[0]).toordinal()
+            cells = list(compress(islice(cells, 1, None), keep))
+            if fixed_point:
+                _check_decimals(cells, line)
+            if anchor is None:
+                anchor = first = last = ordinal
+            if ordinal >= anchor:
+                side, offset, columns = 0, ordinal - anchor, later
+                last = max(last, ordinal)
+            else:
+                side, offset, columns = 1, anchor - 1 - ordinal, earlier
+                first = min(first, ordinal)
+
+            if offset >= capacity[side]:
+                grow = max(offset + 1, 2 * capacity[side], 256) - capacity[side]
+                for pair in sides.values():
+                    column, mask = pair[side]
+                    column.extend(_new_column(grow, cast))
+                    mask.extend(bytes(grow))
+                capacity[side] += grow
+
+            for (column, mask), rate in zip(columns, cells):
+                if rate not in na_values:
+                    if fixed_point:
+                        column[offset] = round(float(rate) * _FIXED_POINT_SCALE)
+                    else:
+                        column[offset] = cast(rate)
+                    mask[offset] = 1
+
+        if anchor is None:
+            raise ValueError("no rates to parse")
+        origin = first
+        size = 1 + last - first
+
+        rates = {}
+        valid = {}
+        for currency, (later_side, earlier_side) in sides.items():
+            column, mask = later_side
+            earlier_column, earlier_mask = earlier_side
+            del column[last - anchor + 1 :], mask[last - anchor + 1 :]
+            del earlier_column[anchor - first :], earlier_mask[anchor - first :]
+            earlier_column.reverse()
+            earlier_mask.reverse()
+            rates[currency] = earlier_column + column
+            valid[currency] = earlier_mask + mask
+        del sides, later, earlier
+
+        if fixed_point and max(map(abs, chain(*rates.values())), default=0) >= 2**50:
+            raise ValueError("rates are too large to be stored as fixed-point rates")
+
+        return cls(
+            origin,
+            size,
+            {c: _freeze(rates[c]) for c, mask in valid.items() if 1 in mask},
+            {c: bytes(mask) for c, mask in valid.items() if 1 in mask},
+        )
+
+    def merge(self, update):
+        """Returns a new table with the rates of another table added.
+
+        Rates of ``update`` replace the rates of the same days, and the new
+        table covers the dates of both tables.
+        """
+        origin = min(self.origin, update.origin)
+        size = max(self.origin + self.size, update.origin + update.size) - origin
+
+        rates = {}
+        valid = {}
+        for currency, column in self.rates.items():
+            shift = self.origin - origin
+            rates[currency] = _empty_like(column, size)
+            rates[currency][shift : shift + self.size] = _copy_column(column)
+            valid[currency] = bytearray(size)
+            valid[currency][shift : shift + self.size] = self.valid[currency]
+
+        for currency, column in update.rates.items():
+            shift = update.origin - origin
+            if currency not in rates:
+                rates[currency] = _empty_like(column, size)
+                valid[currency] = bytearray(size)
+            merged, mask = rates[currency], valid[currency]
+            first, last = update.spans[currency]
+            for offset in range(first, last + 1):
+                if update.valid[currency][offset]:
+                    merged[shift + offset] = column[offset]
+                    mask[shift + offset] = 1
+
+        return RateTable(
+            origin,
+            size,
+            {c: _freeze(column) for c, column in rates.items()},
+            {c: bytes(mask) for c, mask in valid.items()},
+        )
+
+    @classmethod
+    def combine(cls, tables, priorities=None, with_origins=True):
+        """Returns a table of the rates of several tables, and their origins.
+
+        Each rate comes from the first table having it at this day, in the
+        order of ``tables``, or in the order of ``priorities[currency]``.
+
+        :param tables: The tables to combine, by priority.
+        :param dict priorities: Indexes of tables by priority, for the
+            currencies ordering tables differently. Tables that are not
+            listed come next, in their default order.
+        :param bool with_origins: Set to False to skip the origins, which
+            take a byte per day and currency, and cannot index more than 255
+            tables.
+        :return: A ``(table, origins)`` tuple, where ``origins[currency]``
+            has ``1 + index`` of the table of each rate, 0 for missing rates.
+            ``origins`` is None without ``with_origins``.
+        """
+        if with_origins and len(tables) > 255:
+            raise ValueError("the origins of more than 255 tables cannot be kept")
+        priorities = priorities or {}
+        origin = min(table.origin for table in tables)
+        size = max(table.origin + table.size for table in tables) - origin
+
+        rates = {}
+        valid = {}
+        origins = {} if with_origins else None
+        for currency in dict.fromkeys(chain.from_iterable(t.rates for t in tables)):
+            order = list(dict.fromkeys(priorities.get(currency, ())))
+            order += (i for i in range(len(tables)) if i not in order)
+            order = [i for i in order if currency in tables[i].rates]
+
+            # Lower priorities first, overwritten by the rates of higher ones
+            column = mask = None
+            index = bytearray(size) if with_origins else None
+            for i in reversed(order):
+                table = tables[i]
+                shift = table.origin - origin
+                end = shift + table.size
+                source, source_valid = table.rates[currency], table.valid[currency]
+                if column is None:
+                    column = _empty_like(source, size)
+                    mask = bytearray(size)
+                if mask.find(1, shift, end) == -1:
+                    # No rate to keep in the range, such as for the chunks of
+                    # a source parsed in parallel: copy the whole columns
+                    column[shift:end] = _copy_column(source)
+                    mask[shift:end] = source_valid
+                    if with_origins:
+                        index[shift:end] = bytes(source_valid).translate(
+                            bytes([0, i + 1]) + bytes(254)
+                        )
+                    continue
+                first, last = table.spans[currency]
+                for offset in compress(
+                    range(first, last + 1), source_valid[first : last + 1]
+                ):
+                    column[shift + offset] = source[offset]
+                    mask[shift + offset] = 1
+                    if with_origins:
+                        index[shift + offset] = i + 1
+
+            rates[currency] = _freeze(column)
+            valid[currency] = bytes(mask)
+            if with_origins:
+                origins[currency] = bytes(index)
+
+        return cls(origin, size, rates, valid), origins
+
+    @classmethod
+    def from_chunks(
+        cls,
+        lines,
+        na_values=frozenset(["", "N/A"]),
+        cast=float,
+        currencies=None,
+        parallel_threshold=PARALLEL_THRESHOLD,
+        chunk_size=PARSE_CHUNK_SIZE,
+        jobs=None,
+    ):
+        """Parse the lines of a source file by chunks, see :meth:`from_lines`.
+
+        Chunks of ``chunk_size`` lines are parsed into tables, combined at
+        the end, so that rows of the same day repeated in several chunks
+        keep the last available rate. The chunks after ``parallel_threshold``
+        rows are parsed in a pool of ``jobs`` processes, default is the
+        number of CPUs. Sources of at most ``chunk_size`` rows are parsed
+        in one go, like :meth:`from_lines` does.
+        """
+        lines = iter(lines)
+        header = next(lines)
+        if jobs is None:
+            jobs = os.cpu_count() or 1
+        args = na_values, cast, currencies
+
+        tables = []
+        pending = deque()
+        executor = None
+        rows = 0
+        try:
+            while chunk := list(islice(lines, chunk_size)):
+                rows += len(chunk)
+                if executor is None and rows > parallel_threshold and jobs > 1:
+                    from concurrent.futures import ProcessPoolExecutor
+
+                    executor = ProcessPoolExecutor(jobs)
+                if executor is None:
+                    tables.append(cls.from_lines(chain([header], chunk), *args))
+                    continue
+                pending.append(executor.submit(_parse_chunk, header, chunk, *args))
+                while len(pending) > 2 * jobs:  # bound the chunks in flight
+                    tables.append(cls._from_chunk(pending.popleft().result()))
+            while pending:
+                tables.append(cls._from_chunk(pending.popleft().result()))
+        finally:
+            if executor is not None:
+                executor.shutdown(cancel_futures=True)
+
+        if not tables:
+            raise ValueError("no rates to parse")
+        if len(tables) == 1:
+            return tables[0]
+        return cls.combine(tables[::-1], with_origins=False)[0]
+
+    @classmethod
+    def _from_chunk(cls, data):
+        origin, size, rates, valid = data
+        rates = {currency: _freeze(column) for currency, column in rates.items()}
+        return cls(origin, size, rates, valid)
+
+
+class SparseRateTable:
+    """
+    Immutable history of rates, keeping only the available rates.
+
+    This is the storage of converters with ``sparse=True``. Columns do not
+    have a row for each day, so the weekends, holidays and the days after a
+    currency was retired take no space, and missing rates are not filled but
+    looked up from their closest available rates.
+
+    ``offsets`` is a dictionary with currencies as keys, and the sorted day
+    offsets from ``origin`` of the available rates as values.
+    ``rates`` has the same keys, with the rates at these offsets as values.
+    ``spans`` is as in :class:`RateTable`.
+
+    >>> table = SparseRateTable.from_lines(['Date,USD', '2014-03-28,1.3759',
+    ...                                     '2014-03-25,1.3820'])
+    >>> list(table.offsets['USD']), list(table.rates['USD'])
+    ([0, 3], [1.382, 1.3759])
+    """
+
+    def __init__(self, origin, size, offsets, rates):
+        self.origin = origin
+        self.size = size
+        self.offsets = {c: _freeze(column) for c, column in offsets.items()}
+        self.rates = {c: _freeze(column) for c, column in rates.items()}
+        self.spans = {c: (column[0], column[-1]) for c, column in self.offsets.items()}
+        self.source_file = None
+
+    def __reduce__(self):
+        return SparseRateTable, (
+            self.origin,
+            self.size,
+            {c: _copy_column(column) for c, column in self.offsets.items()},
+            {c: _copy_column(column) for c, column in self.rates.items()},
+        )
+
+    def share(self):
+        raise TypeError("sparse tables are not memory-mapped, pickle them instead")
+
+    @classmethod
+    def from_lines(
+        cls, lines, na_values=frozenset(["", "N/A"]), cast=float, currencies=None
+    ):
+        """Parse the lines of a source file, in the ECB format.
+
+        :param currencies: Only parse the columns of these currencies.
+        """
+        lines = iter(lines)
+        header, keep, splits = _read_header(lines, currencies)
+        fixed_point = cast is to_fixed_point
+
+        parsed = {}
+        for currency in header:
+            if currency not in parsed:
+                parsed[currency] = array("i"), _new_column(0, cast)
+        columns = [(parsed[c][0].append, parsed[c][1].append) for c in header]
+
+        for line in lines:
+            cells = line.strip().split(",", splits)
+            ordinal = _parse_date(cells[0]).toordinal()
+            cells = list(compress(islice(cells, 1, None), keep))
+            if fixed_point:
+                _check_decimals(cells, line)
+            for column, rate in zip(columns, cells):
+                if rate not in na_values:
+                    add_ordinal, add_rate = column
+                    add_ordinal(ordinal)
+                    if fixed_point:
+                        add_rate(round(float(rate) * _FIXED_POINT_SCALE))
+                    else:
+                        add_rate(cast(rate))
+
+        parsed = {c: _sort_rates(*column) for c, column in parsed.items() if column[0]}
+        if not parsed:
+            raise ValueError("no rates to parse")
+        origin = min(ordinals[0] for ordinals, _ in parsed.values())
+        size = 1 + max(ordinals[-1] for ordinals, _ in parsed.values()) - origin
+
+        all_rates = chain.from_iterable(rates for _, rates in parsed.values())
+        if fixed_point and max(map(abs, all_rates), default=0) >= 2**50:
+            raise ValueError("rates are too large to be stored as fixed-point rates")
+
+        return cls(
+            origin,
+            size,
+            {
+                c: array("i", [o - origin for o in ordinals])
+                for c, (ordinals, _) in parsed.items()
+            },
+            {c: rates for c, (_, rates) in parsed.items()},
+        )
+
+    def merge(self, update):
+        """Returns a new table with the rates of another table added.
+
+        Rates of ``update`` replace the rates of the same days, and the new
+        table covers the dates of both tables.
+        """
+        origin = min(self.origin, update.origin)
+        size = max(self.origin + self.size, update.origin + update.size) - origin
+
+        merged = {}
+        for table in self, update:
+            for currency, column in table.rates.items():
+                ordinals = (table.origin + o for o in table.offsets[currency])
+                merged.setdefault(currency, {}).update(zip(ordinals, column))
+
+        offsets = {}
+        rates = {}
+        for currency, column in merged.items():
+            ordinals = sorted(column)
+            offsets[currency] = array("i", [o - origin for o in ordinals])
+            rates[currency] = _like(
+                self.rates.get(currency, update.rates.get(currency)),
+                [column[o] for o in ordinals],
+            )
+        return SparseRateTable(origin, size, offsets, rates)
+
+
+def _sort_rates(ordinals, rates):
+    """Sort the rates of a currency by date, the last one read for a repeated date.
+
+    Rows are usually sorted already, from the most recent one in the ECB file.
+    """
+    if all(map(operator.gt, ordinals, islice(ordinals, 1, None))):
+        ordinals.reverse()
+        rates.reverse()
+        return ordinals, rates
+    if all(map(operator.lt, ordinals, islice(ordinals, 1, None))):
+        return ordinals, rates
+    by_ordinal = dict(zip(ordinals, rates))
+    ordinals = sorted(by_ordinal)
+    return array("i", ordinals), _like(rates, [by_ordinal[o] for o in ordinals])
+
+
+class _RateView:
+    """
+    Rates of a table, as seen by a converter.
+
+    The view adds the reference currency to the bounds of the table, and
+    fills the missing rates of a currency with the fallback method the first
+    time the currency is used. Filled columns are private to the view,
+    other columns are shared with the table.
+    """
+
+    sparse = False
+    stats = None  # the ConverterStats timing the fills, if any
+
+    def __init__(self, table, ref_currency, fill_method=None, verbose=False):
+        if fill_method not in (None, *FALLBACK_METHODS):
+            raise ValueError(f"Unknown fallback method {fill_method!r}")
+
+        self.table = table
+        self.origin = table.origin
+        self.ref_currency = ref_currency
+        self.fill_method = fill_method
+        self.verbose = verbose
+
+        self.spans = dict(table.spans)
+        self.spans[ref_currency] = (
+            min(first for first, _ in table.spans.values()),
+            max(last for _, last in table.spans.values()),
+        )
+        self.bounds = {
+            currency: Bounds(self.offset_to_date(first), self.offset_to_date(last))
+            for currency, (first, last) in self.spans.items()
+        }
+        self.currencies = set(table.rates) | {ref_currency}
+        self._columns = {}
+        self._prefix_sums = {}
+        self._sparse_tables = {}
+        self.cross_rates = LRUCache(maxsize=16)
+
+        if verbose:
+            for currency in sorted(table.rates):
+                self._report_missing(currency)
+
+    def offset_to_date(self, offset):
+        return datetime.date.fromordinal(self.origin + offset)
+
+    def column(self, currency):
+        """Returns the rates and validity mask of a currency, filled if needed."""
+        try:
+            return self._columns[currency]
+        except KeyError:
+            pass
+
+        rates = self.table.rates[currency]
+        valid = self.table.valid[currency]
+        first, last = self.spans[currency]
+
+        if self.fill_method is not None and valid.find(0, first, last) != -1:
+            with nullcontext() if self.stats is None else self.stats.timer("fill"):
+                rates, valid = _copy_column(rates), bytearray(valid)
+                getattr(self, f"_use_{self.fill_method}")(currency, rates, valid)
+
+        self._columns[currency] = rates, valid
+        return rates, valid
+
+    def rate(self, currency, offset):
+        """Returns the rate of a currency at an offset, None if it is missing."""
+        rates, valid = self.column(currency)
+        return rates[offset] if valid[offset] else None
+
+    def known(self, currency, offset):
+        """Whether the table has a rate at this offset, not filled by the view."""
+        return bool(self.table.valid[currency][offset])
+
+    def prefix_sums(self, currency):
+        """Returns the running sums and counts of the available rates.
+
+        ``sums[i] + errors[i]`` and ``counts[i]`` are the sum and the number
+        of the available rates before offset ``i``. The sums are compensated
+        (Neumaier), so differences of sums stay accurate on long histories.
+        """
+        try:
+            return self._prefix_sums[currency]
+        except KeyError:
+            pass
+        rates, valid = self.column(currency)
+        total = error = rates[self.spans[currency][0]] * 0
+        sums, errors = [total], [error]
+        for rate, ok in zip(rates, valid):
+            if ok:
+                new_total = total + rate
+                if abs(total) >= abs(rate):
+                    error += (total - new_total) + rate
+                else:
+                    error += (rate - new_total) + total
+                total = new_total
+            sums.append(total)
+            errors.append(error)
+        counts = array("q", accumulate(valid, initial=0))
+        prefix_sums = _like(rates, sums), _like(rates, errors), counts
+        self._prefix_sums[currency] = prefix_sums
+        return prefix_sums
+
+    def sparse_table(self, currency, func):
+        """Returns the sparse table of a currency for ``min`` or ``max``.
+
+        ``table[k][i]`` is ``func`` of the rates from offset ``i`` to
+        ``i + 2 ** k - 1`` included, missing rates being ignored.
+        """
+        key = currency, func
+        try:
+            return self._sparse_tables[key]
+        except KeyError:
+            pass
+        rates, valid = self.column(currency)
+        neutral = _neutral(rates, func)
+        level = _like(
+            rates, [rate if ok else neutral for rate, ok in zip(rates, valid)]
+        )
+        table = [level]
+        width = 1
+        while 2 * width <= len(rates):
+            level = _like(rates, list(map(func, level[:-width], level[width:])))
+            table.append(level)
+            width *= 2
+        self._sparse_tables[key] = table
+        return table
+
+    def reuse_columns(self, view, update):
+        """Reuse the filled columns of a view on the table before ``update``.
+
+        Filled rates up to the last rate known before the first rate of the
+        update do not change, so only the tail of the columns is filled again.
+        """
+        shift = view.origin - self.origin
+        for currency, (old_rates, old_valid) in view._columns.items():
+            if old_rates is view.table.rates[currency]:
+                continue  # nothing was filled
+
+            first, keep = view.spans[currency]
+            if currency in update.rates:
+                changed = update.origin + update.spans[currency][0] - view.origin
+                keep = view.table.valid[currency].rfind(1, 0, max(changed, 0))
+            if keep < first:
+                continue
+
+            rates = _copy_column(self.table.rates[currency])
+            valid = bytearray(self.table.valid[currency])
+            rates[shift + first : shift + keep + 1] = old_rates[first : keep + 1]
+            valid[shift + first : shift + keep + 1] = old_valid[first : keep + 1]
+            getattr(self, f"_use_{self.fill_method}")(currency, rates, valid)
+            self._columns[currency] = rates, valid
+
+    def rebase(self, base, ref_rate):
+        """Returns a table of the rates against another currency.
+
+        The rates of each currency are divided by the rates of ``base`` at
+        the same days, once filled, so the new table gives the same results
+        as converting through the reference currency, at the days ``base``
+        has a rate. The reference currency gets a column of ``ref_rate``
+        divided by the rates of ``base``.
+        Rates are only available at days both rates were, and currencies
+        without any are dropped.
+
+        :param str base: The currency the new rates are oriented towards.
+        :param ref_rate: The rate of the reference currency, 1 as its type.
+        """
+        if base not in self.table.rates:
+            raise ValueError(f"{base} is not a supported currency")
+        base_rates, base_valid = self.column(base)
+        size = self.table.size
+
+        rates = {}
+        valid = {}
+        for currency in chain(self.table.rates, [self.ref_currency]):
+            if currency == base:
+                continue
+            if currency == self.ref_currency:
+                column = _repeat(_like(base_rates, []), ref_rate, size)
+                mask = base_valid
+            else:
+                column, mask = self.column(currency)
+                mask = bytes(map(operator.and_, mask, base_valid))
+            if mask.find(1) == -1:
+                continue
+            if isinstance(column, (array, memoryview)):
+                column = array(
+                    _typecode(column), map(operator.truediv, column, base_rates)
+                )
+            else:
+                column = [
+                    rate / base_rate if ok else None
+                    for rate, base_rate, ok in zip(column, base_rates, mask)
+                ]
+            rates[currency] = _freeze(column)
+            valid[currency] = bytes(mask)
+
+        return RateTable(self.origin, size, rates, valid)
+
+    def _report_missing(self, currency):
+        """Print how many rates of a currency are missing within its bounds."""
+        first, last = self.spans[currency]
+        missing = (
+            1 + last - first - self.table.valid[currency].count(1, first, last + 1)
+        )
+        if missing:
+            first_date, last_date = self.bounds[currency]
+            print(
+                f"{currency}: {missing} missing rates from {first_date} to {last_date}"
+                f" ({1 + (last_date - first_date).days} days)"
+            )
+
+    def _use_linear_interpolation(self, currency, rates, valid):
+        """Fill missing rates of a currency.
+
+        This is done by linear interpolation of the two closest available rates.
+
+        :param str currency: The currency to fill missing rates for.
+        """
+        for start, end in _missing_runs(valid, *self.spans[currency]):
+            # start - 1 and end are the closest rates backward and forward,
+            # and the sum of the distances to both is the same for the run
+            r0, r1 = rates[start - 1], rates[end]
+            n = 1 + end - start
+            for d0 in range(1, n):
+                rate = r0 * (n - d0) + r1 * d0
+                if isinstance(rate, int):  # fixed-point, round half to even
+                    rate, remainder = divmod(rate, n)
+                    rate += 2 * remainder > n or (2 * remainder == n and rate % 2)
+                    rates[start + d0 - 1] = rate
+                else:
+                    rates[start + d0 - 1] = rate / n
+            valid[start:end] = b"\x01" * (end - start)
+            if self.verbose:
+                for d0 in range(1, n):
+                    print(
+                        f"{currency}: filling {self.offset_to_date(start + d0 - 1)}"
+                        f" missing rate using {r0} ({d0}d old) and {r1} ({n - d0}d later)"
+                    )
+
+    def _use_last_known(self, currency, rates, valid):
+        """Fill missing rates of a currency.
+
+        This is done by using the last known rate.
+
+        :param str currency: The currency to fill missing rates for.
+        """
+        for start, end in _missing_runs(valid, *self.spans[currency]):
+            last_rate = rates[start - 1]
+            rates[start:end] = _repeat(rates, last_rate, end - start)
+            valid[start:end] = b"\x01" * (end - start)
+            if self.verbose:
+                last_date = self.offset_to_date(start - 1)
+                for offset in range(start, end):
+                    print(
+                        f"{currency}: filling {self.offset_to_date(offset)} missing rate"
+                        f" using {last_rate} from {last_date}"
+                    )
+
+    def _use_nearest(self, currency, rates, valid):
+        """Fill missing rates of a currency.
+
+        This is done by using the closest available rate, the previous one
+        in case of a tie.
+
+        :param str currency: The currency to fill missing rates for.
+        """
+        for start, end in _missing_runs(valid, *self.spans[currency]):
+            # the first half of the run is closer to start - 1, the rest to end
+            middle = start + (1 + end - start) // 2
+            rates[start:middle] = _repeat(rates, rates[start - 1], middle - start)
+            rates[middle:end] = _repeat(rates, rates[end], end - middle)
+            valid[start:end] = b"\x01" * (end - start)
+            if self.verbose:
+                for offset in range(start, end):
+                    nearest = start - 1 if offset < middle else end
+                    print(
+                        f"{currency}: filling {self.offset_to_date(offset)} missing rate"
+                        f" using {rates[nearest]} from {self.offset_to_date(nearest)}"
+                    )
+
+
+class _SparseRateView(_RateView):
+    """
+    Rates of a :class:`SparseRateTable`, as seen by a converter.
+
+    Missing rates are not filled, the rates around them are found by binary
+    search and the fallback method is applied at each lookup instead. Range
+    queries still need a column for every day, which is filled the first
+    time a range of the currency is queried.
+    """
+
+    sparse = True
+
+    def __init__(self, table, ref_currency, fill_method=None, verbose=False):
+        super().__init__(table, ref_currency, fill_method, verbose)
+        self._known = {c: (table.offsets[c], table.rates[c]) for c in table.rates}
+        self._fill = None
+        if fill_method is not None:
+            self._fill = getattr(self, f"_rate_by_{fill_method}")
+
+    def rate(self, currency, offset):
+        offsets, rates = self._known[currency]
+        i = bisect_right(offsets, offset) - 1  # the last rate at or before offset
+        if offsets[i] == offset:
+            return rates[i]
+        if self._fill is None:
+            return None
+        return self._fill(
+            currency, offset, offsets[i], rates[i], offsets[i + 1], rates[i + 1]
+        )
+
+    def known(self, currency, offset):
+        offsets = self._known[currency][0]
+        i = bisect_right(offsets, offset) - 1
+        return i >= 0 and offsets[i] == offset
+
+    def column(self, currency):
+        try:
+            return self._columns[currency]
+        except KeyError:
+            pass
+
+        offsets = self.table.offsets[currency]
+        known = self.table.rates[currency]
+        rates = _empty_like(known, self.table.size)
+        valid = bytearray(self.table.size)
+        for offset, rate in zip(offsets, known):
+            rates[offset] = rate
+            valid[offset] = 1
+        if self.fill_method is not None and len(offsets) <= offsets[-1] - offsets[0]:
+            verbose, self.verbose = self.verbose, False  # only report lookups
+            try:
+                getattr(self, f"_use_{self.fill_method}")(currency, rates, valid)
+            finally:
+                self.verbose = verbose
+
+        self._columns[currency] = rates, valid
+        return rates, valid
+
+    def reuse_columns(self, view, update):
+        pass  # columns are only filled for range queries, and rarely
+
+    def _report_missing(self, currency):
+        first, last = self.spans[currency]
+        missing = 1 + last - first - len(self.table.offsets[currency])
+        if missing:
+            first_date, last_date = self.bounds[currency]
+            print(
+                f"{currency}: {missing} missing rates from {first_date} to {last_date}"
+                f" ({1 + (last_date - first_date).days} days)"
+            )
+
+    def _rate_by_linear_interpolation(self, currency, offset, o0, r0, o1, r1):
+        """Interpolate linearly between the two closest available rates.
+
+        The result is the same as the rate filled by
+        :meth:`_RateView._use_linear_interpolation`.
+        """
+        n, d0 = o1 - o0, offset - o0
+        rate = r0 * (n - d0) + r1 * d0
+        if isinstance(rate, int):  # fixed-point, round half to even
+            rate, remainder = divmod(rate, n)
+            rate += 2 * remainder > n or (2 * remainder == n and rate % 2)
+        else:
+            rate = rate / n
+        if self.verbose:
+            print(
+                f"{currency}: filling {self.offset_to_date(offset)}"
+                f" missing rate using {r0} ({d0}d old) and {r1} ({n - d0}d later)"
+            )
+        return rate
+
+    def _rate_by_last_known(self, currency, offset, o0, r0, o1, r1):
+        """Use the last known rate."""
+        if self.verbose:
+            print(
+                f"{currency}: filling {self.offset_to_date(offset)} missing rate"
+                f" using {r0} from {self.offset_to_date(o0)}"
+            )
+        return r0
+
+    def _rate_by_nearest(self, currency, offset, o0, r0, o1, r1):
+        """Use the closest available rate, the previous one in case of a tie."""
+        if 2 * offset > o0 + o1:
+            o0, r0 = o1, r1
+        if self.verbose:
+            print(
+                f"{currency}: filling {self.offset_to_date(offset)} missing rate"
+                f" using {r0} from {self.offset_to_date(o0)}"
+            )
+        return r0
+
+
+# Tables currently in use, by content and parsing options
+_shared_tables = weakref.WeakValueDictionary()
+
+# Methods shadowed by counting ones on converters collecting stats
+_COUNTED_METHODS = ("convert", "convert_many", "cross_rates", "pair")
+_INSTRUMENTED_METHODS = (*_COUNTED_METHODS, "_get_rate_at")
+
+
 class CurrencyConverter:
     """
     At init, load the historic currencies (since 1999) from the ECB.
@@ -79,10 +1485,9 @@ class CurrencyConverter:
     2014-03-28,1.3759,140.9,1.9558,N/A,27.423,...
     2014-03-27,1.3758,...
 
-    ``_rates`` is a dictionary with:
-
-    - currencies as keys
-    - {date: rate, ...} as values.
+    The parsed rates are kept in a :class:`RateTable`, shared with the other
+    converters loading the same data. ``_view`` applies the fallback options
+    of this converter on top of it.
 
     ``currencies`` is a set of all available currencies.
     ``bounds`` is a dict if first and last date available per currency.
@@ -98,6 +1503,15 @@ class CurrencyConverter:
         na_values=frozenset(["", "N/A"]),
         decimal=False,
         verbose=False,
+        cache_dir=None,
+        exact=False,
+        rounding=ROUND_HALF_EVEN,
+        places=None,
+        sparse=False,
+        currencies=None,
+        base=None,
+        parallel_threshold=PARALLEL_THRESHOLD,
+        collect_stats=False,
     ):
         """Instantiate a CurrencyConverter.
 
@@ -116,7 +1530,8 @@ class CurrencyConverter:
             Set to False to raise RateNotFoundError when hitting a missing rate,
             e.g. on weekends or banking holidays.
         :param bool fallback_on_missing_rate_method: Choose the fallback on missing
-            rate method. Default is "linear_interpolation", also available is "last_known".
+            rate method. Default is "linear_interpolation", also available are
+            "last_known" and "nearest" (the closest known rate).
         :param str ref_currency: Three-letter currency code for the currency
             that the source data is oriented towards. This is EUR for the
             default European Central Bank data, and so the default is 'EUR'.
@@ -125,158 +1540,443 @@ class CurrencyConverter:
         :param decimal: Set to True to use decimal.Decimal internally, this will
             slow the loading time but will allow exact conversions
         :param verbose: Set to True to print what is going on under the hood.
+        :param str cache_dir: Directory where a binary cache of the loaded
+            rates is kept, keyed by the content of the source data and the
+            parsing options. Later loads of the same data memory-map the cache
+            instead of parsing the source again. Default is None, no cache.
+            The cache is not used with ``decimal``.
+        :param bool exact: Set to True to store rates as integers, in units of
+            ``10 ** -FIXED_POINT_PLACES``, and convert with integer arithmetic.
+            Results are Decimal, rounded only once from the exact result. This
+            loads and converts faster than ``decimal``, but source rates cannot
+            have more than ``FIXED_POINT_PLACES`` decimals.
+        :param str rounding: With ``exact``, the rounding mode of the results,
+            one of the ``decimal.ROUND_*`` constants. Default is half-even.
+        :param int places: With ``exact``, the number of decimals of the
+            converted amounts. Default is None, rounding them to the precision
+            of the current decimal context instead. Rates, such as cross rates
+            and average rates, are not rounded to ``places``.
+        :param bool sparse: Set to True to only store the available rates,
+            without the weekends, holidays and the days after a currency was
+            retired. Lookups use a binary search, and missing rates are
+            computed at each lookup instead of being filled. This takes less
+            memory and loads faster when many currencies use fallbacks, but
+            lookups are slower, and the rates are not cached nor shared.
+        :param iterable currencies: Only load the rates of these currencies,
+            the columns of the other currencies are not parsed. This loads
+            faster and takes less memory when only a few currencies are used.
+            Default is None, all the currencies of the source data. Loading
+            raises ValueError if some of them are not in the source data.
+            A single currency can be given as a string. The selection must
+            include a currency other than ``ref_currency``.
+        :param str base: Three-letter currency code to rebase the rates to.
+            The rates are divided once by the rates of ``base`` when loaded,
+            so conversions from or to ``base`` only need its rate of the
+            other currency. Missing rates are filled before rebasing, when
+            ``fallback_on_missing_rate`` is set. At the dates ``base`` has a
+            rate, filled or not, results are the same as with the reference
+            currency, up to rounding. At other dates, conversions raise
+            RateNotFoundError, even from the reference currency to itself,
+            and conversions from ``base`` to itself are always available:
+            the bounds of each currency are intersected with the bounds of
+            ``base``. Updates are merged into the rates of the source data,
+            which are then filled and rebased again, and are not written to
+            the cache. Not available with
+            ``fallback_on_wrong_date``, which extrapolates each currency from
+            its own bounds, with ``exact``, whose rates cannot be divided
+            exactly, nor with ``sparse``.
+        :param int parallel_threshold: Number of rows of the source data
+            after which the rows are parsed by chunks in a process pool, when
+            there are several CPUs. Large sources are parsed by chunks in any
+            case, see :meth:`RateTable.from_chunks`. Set to None to parse
+            all the rows in one go. Sparse rates are always parsed in one go.
+        :param bool collect_stats: Set to True to count the calls, fallbacks
+            and errors of this converter, and time its loads, see
+            :meth:`stats`. Default is False, which costs nothing: the counting
+            methods only replace the plain ones on converters collecting.
         """
+        if base is not None and (exact or sparse):
+            raise ValueError("base cannot be used with exact or sparse rates")
+        if base not in (None, ref_currency) and fallback_on_wrong_date:
+            raise ValueError("base cannot be used with fallback_on_wrong_date")
+        if isinstance(currencies, str):
+            currencies = [currencies]
+        if currencies is not None and not set(currencies) - {ref_currency}:
+            raise ValueError(
+                f"currencies must include a currency other than {ref_currency}"
+            )
+
         # Global options
         self.fallback_on_wrong_date = fallback_on_wrong_date
         self.fallback_on_missing_rate = fallback_on_missing_rate
         self.fallback_on_missing_rate_method = fallback_on_missing_rate_method
         self.ref_currency = ref_currency  # reference currency of rates
         self.na_values = na_values  # missing values
-        self.cast = Decimal if decimal else float
+        self.cast = Decimal if decimal or exact else float
         self.verbose = verbose
+        self.cache_dir = cache_dir
+        self.exact = exact
+        self.rounding = rounding
+        self.places = places
+        self.sparse = sparse
+        self.selected_currencies = None if currencies is None else frozenset(currencies)
+        self.base = None if base == ref_currency else base
+        self.parallel_threshold = parallel_threshold
+        self._parse_rate = to_fixed_point if exact else self.cast
+        self._table_class = SparseRateTable if sparse else RateTable
+        self._ref_rate = _FIXED_POINT_SCALE if exact else self.cast("1")
+        self._stats = ConverterStats() if collect_stats else None
+        if collect_stats:
+            self._instrument()
 
         # Will be filled once the file is loaded
-        self._rates = None
-        self.bounds = None
-        self.currencies = None
+        self._view = None
+        self._table_key = None
+        self._cache_file = None
+        self._source_table = None  # the table before rebasing, with base
 
         if currency_file is not None:
             self.load_file(currency_file)
 
-    def load_file(self, currency_file):
-        """To be subclassed if alternate methods of loading data."""
-        if currency_file.startswith(("http://", "https://")):
-            content = urlopen(currency_file).read()
+    def __getstate__(self):
+        # Send the table, which pickles as a file to map, not the filled columns
+        state = self.__dict__.copy()
+        view = state.pop("_view")
+        source_table = state.pop("_source_table", None)
+        if source_table is not None:  # rebased again, so it can be updated
+            state["_table"] = source_table
         else:
-            with open(currency_file, "rb") as f:
-                content = f.read()
+            state["_table"] = None if view is None else view.table
+        for name in _INSTRUMENTED_METHODS:
+            state.pop(name, None)  # counting wrappers are made again
+        return state
+
+    def __setstate__(self, state):
+        table = state.pop("_table")
+        self.__dict__.update(state, _view=None, _source_table=None)
+        if self._stats is not None:
+            self._instrument()
+        if table is not None:
+            self._set_table(table)
+
+    def _instrument(self):
+        """Shadow the hot methods of this converter with counting ones.
+
+        Converters not collecting stats keep the plain methods, so the
+        counting costs nothing to them. Rare events, such as fallbacks or
+        errors, are counted where they happen instead.
+        """
+        stats = self._stats
+        cls = type(self)
+        for name in _COUNTED_METHODS:
+            method = getattr(cls, name).__get__(self, cls)
+            setattr(self, name, _counting(method, stats, name))
+
+        get_rate_at = cls._get_rate_at.__get__(self, cls)
+
+        def counted_get_rate_at(currency, offset, view):
+            rate = get_rate_at(currency, offset, view)
+            if view.fill_method is not None and currency != view.ref_currency:
+                first, last = view.spans[currency]
+                if first <= offset <= last and not view.known(currency, offset):
+                    stats.count("fallback.missing_rate")
+            return rate
+
+        self._get_rate_at = counted_get_rate_at
+
+    def _count(self, name, n=1):
+        if self._stats is not None:
+            self._stats.count(name, n)
+
+    def _timer(self, name):
+        return nullcontext() if self._stats is None else self._stats.timer(name)
+
+    def stats(self):
+        """Returns the counters and timings collected with ``collect_stats``.
+
+        Counters are:
+
+        - ``convert``, ``convert_many``, ``cross_rates``, ``pair``: calls,
+          and ``convert_many.rows``: converted rows.
+        - ``fallback.wrong_date``: rates extrapolated from a bound.
+        - ``fallback.missing_rate``: rates filled by the fallback method.
+        - ``rate_not_found``: raised :class:`RateNotFoundError`, including
+          the ones reported as errors by :meth:`convert_many`.
+        - ``table.shared``, ``table.cached``, ``table.parsed``: loaded
+          tables shared by another converter, read from the cache or parsed.
+        - ``cross_rates.cached``: matrices found in the cache.
+        - ``refresh.error``: failed refreshes of a
+          :class:`RefreshingCurrencyConverter`.
+
+        Fallbacks and errors are counted per rate lookup. Batches, such as
+        :meth:`convert_many`, :meth:`convert_series` and :meth:`cross_rates`,
+        look up each distinct (currency, date) once, so they count their
+        fallbacks and errors once per distinct lookup, not once per row.
+        Pairs read the rates filled within the bounds from their own columns:
+        their calls and these rates are not counted, only their
+        extrapolations and errors.
+
+        Timings are ``load`` and its phases ``load.hash``, ``load.cache_read``,
+        ``load.parse``, ``load.cache_write``, ``load.combine`` (of the sources
+        of a :class:`FederatedCurrencyConverter`) and ``load.view``, ``update``,
+        and ``fill``, the filling of a currency by the fallback method.
+
+        :return: A dict like :meth:`ConverterStats.snapshot`, or None if
+            stats are not collected.
 
-        if currency_file.endswith(".zip"):
-            self.load_lines(get_lines_from_zip(content))
-        else:
-            self.load_lines(content.decode("utf-8").splitlines())
+        >>> from datetime import date
+        >>> c = CurrencyConverter(collect_stats=True, fallback_on_wrong_date=True)
+        >>> c.convert(100, 'USD', date=date(1980, 1, 1))
+        84.8...
+        >>> counters = c.stats()['counters']
+        >>> counters['convert'], counters['fallback.wrong_date']
+        (1, 1)
+        """
+        return None if self._stats is None else self._stats.snapshot()
 
-    def load_lines(self, lines):
-        _rates = self._rates = defaultdict(dict)
-        na_values = self.na_values
-        cast = self.cast
+    def add_stats_hook(self, hook):
+        """Call ``hook(name, value)`` at each counted or timed event.
 
-        lines = iter(lines)
-        header = next(lines).strip().split(",")[1:]
+        See :meth:`ConverterStats.add_hook`, and :meth:`stats` for the names.
+        """
+        if self._stats is None:
+            raise ValueError("stats are not collected, use collect_stats=True")
+        self._stats.add_hook(hook)
 
-        for line in lines:
-            line = line.strip().split(",")
-            date = parse_date(line[0])
-            for currency, rate in zip(header, line[1:]):
-                currency = currency.strip()
-                if rate not in na_values and currency:  # skip empty currency
-                    _rates[currency][date] = cast(rate)
-
-        self.currencies = set(self._rates) | {self.ref_currency}
-        self._compute_bounds()
-
-        for currency in sorted(self._rates):
-            self._set_missing_to_none(currency)
-            if self.fallback_on_missing_rate:
-                method = self.fallback_on_missing_rate_method
-                if method == "linear_interpolation":
-                    self._use_linear_interpolation(currency)
-                elif method == "last_known":
-                    self._use_last_known(currency)
-                else:
-                    raise ValueError(f"Unknown fallback method {method!r}")
+    def reset_stats(self):
+        if self._stats is not None:
+            self._stats.clear()
 
-    def _compute_bounds(self):
-        self.bounds = {
-            currency: Bounds(min(r), max(r)) for currency, r in self._rates.items()
-        }
+    @classmethod
+    def attach(cls, name, **kwargs):
+        """Instantiate a CurrencyConverter from rates shared by another process.
 
-        self.bounds[self.ref_currency] = Bounds(
-            min(b.first_date for b in self.bounds.values()),
-            max(b.last_date for b in self.bounds.values()),
-        )
+        The rates are memory-mapped, not copied, so all processes attached
+        to the same table share their memory.
 
-    def _set_missing_to_none(self, currency):
-        """Fill missing rates of a currency with the closest available ones."""
-        rates = self._rates[currency]
-        first_date, last_date = self.bounds[currency]
+        :param str name: The name returned by :meth:`share`.
+        :param kwargs: The other options of the converter, such as fallbacks.
 
-        for date in list_dates_between(first_date, last_date):
-            if date not in rates:
-                rates[date] = None
+        >>> c = CurrencyConverter.attach(CurrencyConverter().share())
+        >>> c.convert(100, 'EUR', 'USD', date=datetime.date(2013, 3, 21))
+        129.1...
+        """
+        table = read_cache(name)
+        table.shared = True
+        converter = cls(None, **kwargs)
+        converter._set_table(table)
+        return converter
+
+    def share(self):
+        """Share the rates of this converter with other processes.
+
+        The rates are shared as long as this converter, or another one
+        using the same table, is alive.
+
+        :return: A name to use with :meth:`attach` in the other processes.
+            Once shared or attached, converters pickle as this name, so they
+            can be sent to workers without copying the rates. Otherwise they
+            pickle by value.
+        """
+        return self._view.table.share()
 
-        if self.verbose:
-            missing = len([r for r in rates.values() if r is None])
-            if missing:
-                print(
-                    f"{currency}: {missing} missing rates from {first_date} to {last_date}"
-                    f" ({1 + (last_date - first_date).days} days)"
-                )
+    @property
+    def bounds(self):
+        return None if self._view is None else self._view.bounds
 
-    def _use_linear_interpolation(self, currency):
-        """Fill missing rates of a currency.
+    @property
+    def currencies(self):
+        return None if self._view is None else self._view.currencies
 
-        This is done by linear interpolation of the two closest available rates.
-
-        :param str currency: The currency to fill missing rates for.
+    def load_file(self, currency_file):
+        """To be subclassed if alternate methods of loading data."""
+        with self._timer("load"):
+            table, key, cache_file = self._load_table(currency_file)
+            with self._timer("load.view"):
+                self._set_table(table)
+        self._table_key = key
+        self._cache_file = cache_file
+
+    def _load_table(self, currency_file):
+        """Returns the table of a source, its key and its cache file.
+
+        The table is parsed only if no converter shares it already, and if
+        it is not in the cache. Parsed tables are written to the cache, which
+        replaces cache files that could not be read.
         """
-        rates = self._rates[currency]
+        with open_content(currency_file) as content:
+            with self._timer("load.hash"):
+                key = self._get_table_key(content)
+            cache_file = self._get_cache_file(key)
+            table = _shared_tables.get(key)
+            if table is not None:
+                self._count("table.shared")
+
+            if table is None and cache_file is not None:
+                with self._timer("load.cache_read"):
+                    table = self._load_cache(cache_file)
+                if table is not None:
+                    self._count("table.cached")
+
+            parsed = table is None
+            if parsed:
+                with self._timer("load.parse"):
+                    lines = get_lines(content, currency_file.endswith(".zip"))
+                    table = self._parse_lines(self._table_class, lines)
+                self._count("table.parsed")
+
+        if cache_file is not None and (parsed or not op.exists(cache_file)):
+            with self._timer("load.cache_write"):
+                self._save_cache(cache_file, table)
+
+        _shared_tables[key] = table
+        return table, key, cache_file
+
+    def _get_table_key(self, content):
+        """Key of the table parsed from this content with these options.
+
+        :param content: The source data, as a binary file read by chunks.
+        """
+        key = hash_content(content)
+        options = (
+            CACHE_MAGIC.decode(),
+            sys.byteorder,
+            sorted(self.na_values),
+            self._parse_rate.__name__,
+        )
+        if self.sparse:
+            options += ("sparse",)
+        if self.selected_currencies is not None:
+            options += (sorted(self.selected_currencies),)
+        key.update(json.dumps(options).encode())
+        return key.hexdigest()
+
+    def _get_cache_file(self, key):
+        if self.cache_dir is None or self._parse_rate is Decimal or self.sparse:
+            return None
+        return op.join(self.cache_dir, f"{key}.rates")
+
+    def _load_cache(self, cache_file):
+        """Memory-map the rates from a cache file, returns None if unusable."""
+        try:
+            return read_cache(cache_file)
+        except (OSError, ValueError):
+            return None
+
+    def _save_cache(self, cache_file, table):
+        """Write a table to a cache file, returns False if it failed."""
+        try:
+            write_cache(cache_file, table)
+        except OSError as e:
+            if self.verbose:
+                print(rf"/!\ could not write cache file {cache_file}: {e}")
+            return False
+        return True
 
-        # tmp will store the closest rates forward and backward
-        tmp = defaultdict(lambda: [None, None])
+    def _parse_lines(self, table_class, lines):
+        args = self.na_values, self._parse_rate, self.selected_currencies
+        if table_class is RateTable and self.parallel_threshold is not None:
+            return table_class.from_chunks(lines, *args, self.parallel_threshold)
+        return table_class.from_lines(lines, *args)
 
-        for date in sorted(rates):
-            rate = rates[date]
-            if rate is not None:
-                closest_rate = rate
-                dist = 0
-            else:
-                dist += 1
-                tmp[date][0] = closest_rate, dist
+    def load_lines(self, lines):
+        self._set_table(self._parse_lines(self._table_class, lines))
+        self._table_key = None
+        self._cache_file = None
 
-        for date in sorted(rates, reverse=True):
-            rate = rates[date]
-            if rate is not None:
-                closest_rate = rate
-                dist = 0
-            else:
-                dist += 1
-                tmp[date][1] = closest_rate, dist
+    def apply_update(self, update):
+        """Merge new rates into the loaded rates, without loading them again.
 
-        for date in sorted(tmp):
-            (r0, d0), (r1, d1) = tmp[date]
-            rates[date] = (r0 * d1 + r1 * d0) / (d0 + d1)
-            if self.verbose:
-                print(
-                    f"{currency}: filling {date} missing rate using"
-                    f" {r0} ({d0}d old) and {r1} ({d1}d later)"
-                )
+        This is meant for the single day file of the ECB, or any short range
+        of rates in the same format. Rates of the update replace the loaded
+        rates of the same days, and the bounds are extended to the new dates.
+        Missing rates are only filled again after the first updated day.
 
-    def _use_last_known(self, currency):
-        """Fill missing rates of a currency.
+        Other converters sharing the loaded rates are not affected, but the
+        updated rates are written to the cache file if ``cache_dir`` is used,
+        and used by the next converters loading the same source data.
 
-        This is done by using the last known rate.
+        :param update: Path or URL of the update, like the ``currency_file``
+            of the converter, or an iterable of lines.
 
-        :param str currency: The currency to fill missing rates for.
+        >>> c = CurrencyConverter(SINGLE_DAY_CURRENCY_FILE)
+        >>> c.apply_update(['Date,USD', '2000-01-03,1.009'])
+        >>> c.bounds['USD'].first_date
+        datetime.date(2000, 1, 3)
         """
-        rates = self._rates[currency]
-
-        for date in sorted(rates):
-            rate = rates[date]
-            if rate is not None:
-                last_rate, last_date = rate, date
-            else:
-                rates[date] = last_rate
-                if self.verbose:
-                    print(
-                        f"{currency}: filling {date} missing rate using"
-                        f" {last_rate} from {last_date}"
-                    )
-
-    def _get_rate(self, currency, date):
+        with self._timer("update"):
+            self._apply_update(update)
+
+    def _apply_update(self, update):
+        old_view = self._view
+        table_class = type(old_view.table)  # dense tables may be attached
+        if isinstance(update, str):
+            with open_content(update) as content:
+                lines = get_lines(content, update.endswith(".zip"))
+                update = self._parse_lines(table_class, lines)
+        else:
+            update = self._parse_lines(table_class, update)
+        if self._source_table is not None:
+            # Filling then rebasing the merged rates gives the same rates as
+            # loading them, unlike filling the gap between rebased rates
+            self._set_table(self._source_table.merge(update))
+            return
+        if self.base is not None:  # attached rebased tables have no source
+            update = _RateView(update, self.ref_currency).rebase(
+                self.base, self._ref_rate
+            )
+
+        table = old_view.table.merge(update)
+        view = type(old_view)(
+            table, old_view.ref_currency, old_view.fill_method, self.verbose
+        )
+        view.stats = self._stats
+        view.reuse_columns(old_view, update)
+
+        if self.base is None:  # the cache and shared tables are not rebased
+            if self._cache_file is not None and self._save_cache(
+                self._cache_file, table
+            ):
+                table.source_file = self._cache_file
+            if self._table_key is not None:
+                _shared_tables[self._table_key] = table
+
+        self._view = view
+
+    def _set_table(self, table):
+        if self.selected_currencies is not None:
+            missing = self.selected_currencies - set(table.rates) - {self.ref_currency}
+            if missing:
+                raise ValueError(
+                    f"{', '.join(sorted(missing))} not in the source data currencies"
+                )
+        fill_method = None
+        if self.fallback_on_missing_rate:
+            fill_method = self.fallback_on_missing_rate_method
+        view_class = (
+            _SparseRateView if isinstance(table, SparseRateTable) else _RateView
+        )
+        ref_currency = self.ref_currency
+        if self.base is not None:
+            ref_currency = self.base
+            # Rebased tables, such as the ones of rebased converters attached,
+            # have a column for the reference currency
+            self._source_table = None
+            if self.ref_currency not in table.rates:
+                view = _RateView(table, self.ref_currency, fill_method)
+                self._source_table = table
+                table = view.rebase(self.base, self._ref_rate)
+        view = view_class(table, ref_currency, fill_method, self.verbose)
+        view.stats = self._stats
+        self._view = view
+
+    def _get_rate(self, currency, date, view=None):
         """Get a rate for a given currency and date.
 
-        :type date: datetime.date
+        :param date: The date, as accepted by :func:`to_ordinal`.
+        :param view: The rates to use, default is the current ones. Callers
+            doing several lookups pass the same view to all of them, so they
+            are consistent even if the rates are replaced in the meantime.
 
         >>> from datetime import date
         >>> c = CurrencyConverter()
@@ -286,23 +1986,37 @@ class CurrencyConverter:
         Traceback (most recent call last):
         RateNotFoundError: BGN has no rate for 2010-11-21
         """
-        if currency == self.ref_currency:
-            return self.cast("1")
+        if view is None:
+            view = self._view
+        ordinal = date if type(date) is int else to_ordinal(date)
+        return self._get_rate_at(currency, ordinal - view.origin, view)
 
-        if date not in self._rates[currency]:
-            first_date, last_date = self.bounds[currency]
+    def _get_rate_at(self, currency, offset, view):
+        """Get a rate for a given currency and day offset from ``view.origin``.
+
+        Dates are only made for the messages, lookups use the offsets.
+        """
+        if currency == view.ref_currency:
+            return self._ref_rate
+
+        first, last = view.spans[currency]
+        fallback_date = None
+
+        if not first <= offset <= last:
+            first_date, last_date = view.bounds[currency]
+            date = _offset_to_str(view, offset)
 
             if not self.fallback_on_wrong_date:
+                self._count("rate_not_found")
                 raise RateNotFoundError(
                     f"{date} not in {currency} bounds {first_date}/{last_date}"
                 )
 
-            if date < first_date:
-                fallback_date = first_date
-            elif date > last_date:
-                fallback_date = last_date
+            self._count("fallback.wrong_date")
+            if offset < first:
+                fallback_date, offset = first_date, first
             else:
-                raise AssertionError("Should never happen, bug in the code!")
+                fallback_date, offset = last_date, last
 
             if self.verbose:
                 print(
@@ -310,12 +2024,17 @@ class CurrencyConverter:
                     f" falling back to {fallback_date}"
                 )
 
-            date = fallback_date
-
-        rate = self._rates[currency][date]
-        if rate is None:
-            raise RateNotFoundError(f"{currency} has no rate for {date}")
-        return rate
+        if view.sparse:
+            rate = view.rate(currency, offset)
+            if rate is not None:
+                return rate
+        else:
+            rates, valid = view.column(currency)
+            if valid[offset]:
+                return rates[offset]
+        date = fallback_date or _offset_to_str(view, offset)
+        self._count("rate_not_found")
+        raise RateNotFoundError(f"{currency} has no rate for {date}")
 
     def convert(self, amount, currency, new_currency="EUR", date=None):
         """Convert amount from a currency to another one.
@@ -324,7 +2043,9 @@ class CurrencyConverter:
         :param str currency: The currency to convert from.
         :param str new_currency: The currency to convert to.
         :param datetime.date date: Use the conversion rate of this date. If this
-            is not given, the most recent rate is used.
+            is not given, the most recent rate is used. Datetimes, NumPy
+            ``datetime64``, ``YYYY-MM-DD`` strings and ordinals (the fastest)
+            are accepted too, see :func:`to_ordinal`.
 
         :return: The value of `amount` in `new_currency`.
         :rtype: float
@@ -339,23 +2060,618 @@ class CurrencyConverter:
         Traceback (most recent call last):
         RateNotFoundError: BGN has no rate for 2010-11-21
         """
+        view = self._view
+
         for c in currency, new_currency:
-            if c not in self.currencies:
+            if c not in view.currencies:
                 raise ValueError(f"{c} is not a supported currency")
 
         if date is None:
-            date = self.bounds[currency].last_date
+            offset = view.spans[currency][1]
+        elif type(date) is int:
+            offset = date - view.origin
         else:
             try:
-                date = date.date()  # fallback if input was a datetime object
+                offset = date.toordinal() - view.origin  # date, datetime
             except AttributeError:
-                pass
+                offset = to_ordinal(date) - view.origin
 
-        r0 = self._get_rate(currency, date)
-        r1 = self._get_rate(new_currency, date)
+        r0 = self._get_rate_at(currency, offset, view)
+        r1 = self._get_rate_at(new_currency, offset, view)
 
+        if self.exact:
+            return self._convert_exact(amount, r0, r1)
         return self.cast(amount) / r0 * r1
 
+    def _convert_exact(self, amount, r0, r1):
+        """Convert with fixed-point rates, rounding only the result."""
+        amount = _EXACT_CONTEXT.multiply(Decimal(amount), r1)
+        if self.places is None:
+            context = decimal.getcontext()
+            if context.rounding == self.rounding:
+                return context.divide(amount, r0)
+            return _divide(amount, r0, None, self.rounding)
+        numerator, denominator = amount.as_integer_ratio()
+        return _divide(numerator, denominator * r0, self.places, self.rounding)
+
+    def pair(self, currency, new_currency="EUR"):
+        """Returns a function converting from a currency to another one.
+
+        The currencies are validated and their rates are filled once, so
+        calling the pair only costs a lookup by date, which is faster than
+        :meth:`convert` in loops converting the same currencies many times.
+        The pair keeps the rates of the moment it was made: make a new pair
+        after the rates are reloaded or updated.
+
+        :param str currency: The currency to convert from.
+        :param str new_currency: The currency to convert to.
+        :return: A :class:`CurrencyPair`.
+
+        >>> from datetime import date
+        >>> c = CurrencyConverter()
+        >>> usd_to_jpy = c.pair('USD', 'JPY')
+        >>> usd_to_jpy(100, date(2014, 3, 28)) == c.convert(100, 'USD', 'JPY', date(2014, 3, 28))
+        True
+        """
+        return CurrencyPair(self, currency, new_currency)
+
+    def convert_many(self, amounts, currencies, new_currencies="EUR", dates=None):
+        """Convert many amounts at once.
+
+        ``currencies``, ``new_currencies`` and ``dates`` are either sequences
+        with one item per amount (lists, NumPy arrays, ...), or single values
+        used for all amounts. Currencies are validated and rates are looked up
+        once per distinct (currency, date), and the fallback options apply the
+        same way as in :meth:`convert`.
+
+        Rows that cannot be converted do not raise: they are reported in the
+        returned errors mask, and their value is NaN (None with ``decimal``).
+
+        :param amounts: The amounts to convert.
+        :param currencies: The currencies to convert from.
+        :param new_currencies: The currencies to convert to.
+        :param dates: The dates of the rates, None uses the most recent rate.
+
+        :return: A ``(values, errors)`` tuple, where ``values`` is an
+            ``array('d')`` of converted amounts (a list with ``decimal``), and
+            ``errors`` a ``bytearray`` with 1 for rows that failed.
+
+        >>> from datetime import date
+        >>> c = CurrencyConverter()
+        >>> values, errors = c.convert_many(
+        ...     [100, 100, 100], ['EUR', 'EUR', 'AAA'], 'USD',
+        ...     [date(2013, 3, 21), date(2013, 3, 23), date(2013, 3, 21)])
+        >>> list(errors)
+        [0, 1, 1]
+        >>> values[0]
+        129.1...
+        """
+        n = len(amounts)
+        currencies = _broadcast(currencies, n, "currencies")
+        new_currencies = _broadcast(new_currencies, n, "new_currencies")
+        dates = _broadcast(dates, n, "dates")
+        self._count("convert_many.rows", n)
+
+        cast = self.cast
+        exact = self.exact
+        values = _new_column(n, cast)
+        errors = bytearray(n)
+
+        view = self._view
+        supported = view.currencies
+        spans = view.spans
+        origin = view.origin
+        rates = {}
+
+        def get_rate(currency, offset):
+            key = currency, offset
+            try:
+                return rates[key]
+            except KeyError:
+                pass
+            if currency not in supported:
+                rate = None
+            else:
+                try:
+                    rate = self._get_rate_at(currency, offset, view)
+                except RateNotFoundError:
+                    rate = None
+            rates[key] = rate
+            return rate
+
+        rows = zip(amounts, currencies, new_currencies, dates)
+        for i, (amount, currency, new_currency, date) in enumerate(rows):
+            if date is None:  # the most recent rate of the source currency
+                if currency not in supported:
+                    errors[i] = 1
+                    continue
+                offset = spans[currency][1]
+            elif type(date) is int:
+                offset = date - origin
+            else:
+                try:
+                    offset = date.toordinal() - origin  # date, datetime
+                except AttributeError:
+                    try:
+                        offset = to_ordinal(date) - origin
+                    except (TypeError, ValueError):
+                        errors[i] = 1
+                        continue
+            r0 = get_rate(currency, offset)
+            r1 = get_rate(new_currency, offset)
+            if r0 is None or r1 is None:
+                errors[i] = 1
+                continue
+            try:
+                if exact:
+                    values[i] = self._convert_exact(amount, r0, r1)
+                else:
+                    values[i] = cast(amount) / r0 * r1
+            except (ArithmeticError, TypeError, ValueError):
+                errors[i] = 1
+
+        return values, errors
+
+    def convert_series(self, amounts, currencies, new_currencies="EUR", dates=None):
+        """Convert pandas columns of amounts at once.
+
+        This requires pandas. The arguments are the same as in
+        :meth:`convert_many`, as Series, arrays (including Arrow-backed ones)
+        or single values. Dates of integer dtypes, and single ``int`` dates,
+        are ordinals, as with :func:`to_ordinal`, not timestamps. The
+        distinct (currency, new currency, date) rows
+        are factorized, their rates are looked up once each, then broadcast
+        back to the rows, so the cost is driven by the number of distinct
+        rows rather than by the length of the columns.
+
+        Rows that cannot be converted are NaN.
+
+        :return: A Series of converted amounts, with the index of
+            ``amounts`` if it is a Series.
+
+        >>> import pandas as pd  # doctest: +SKIP
+        >>> c = CurrencyConverter()  # doctest: +SKIP
+        >>> c.convert_series(pd.Series([100, 10]), 'EUR', 'USD',
+        ...                  pd.Series(['2013-03-21', '2013-03-21']))  # doctest: +SKIP
+        0    129.10
+        1     12.91
+        dtype: float64
+        """
+        import numpy as np
+        import pandas as pd
+
+        n = len(amounts)
+        index = amounts.index if isinstance(amounts, pd.Series) else None
+        columns = {
+            "currencies": currencies,
+            "new_currencies": new_currencies,
+            "dates": dates,
+        }
+        for name, values in columns.items():
+            if _is_single_value(values):
+                continue
+            if len(values) != n:
+                raise ValueError(f"{name} has {len(values)} items, expected {n}")
+            if name == "dates":
+                values = pd.Series(values)
+                if not pd.api.types.is_integer_dtype(values.dtype):
+                    values = pd.to_datetime(values)
+                columns[name] = values.to_numpy()
+            else:
+                columns[name] = np.asarray(values, dtype=object)
+        if isinstance(columns["dates"], (str, datetime.date)):
+            columns["dates"] = pd.Timestamp(columns["dates"])
+
+        # One code per distinct row, refactorized after each column so that
+        # codes stay below n * n
+        codes = np.zeros(n, dtype=np.int64)
+        for values in columns.values():
+            if isinstance(values, np.ndarray):
+                value_codes, uniques = pd.factorize(values, use_na_sentinel=False)
+                codes, _ = pd.factorize(codes * len(uniques) + value_codes)
+        first_rows = np.zeros(codes.max(initial=0) + 1, dtype=np.int64)
+        first_rows[codes[::-1]] = np.arange(n - 1, -1, -1)
+
+        view = self._view
+        cast = self.cast
+        missing = cast("nan")
+        r0 = np.empty(len(first_rows), dtype=object)
+        r1 = np.empty(len(first_rows), dtype=object)
+        for i, row in enumerate(first_rows):
+            currency, new_currency, date = (
+                values[row] if isinstance(values, np.ndarray) else values
+                for values in columns.values()
+            )
+            r0[i] = r1[i] = missing
+            if currency not in view.currencies or new_currency not in view.currencies:
+                continue
+            if pd.isna(date):
+                offset = view.spans[currency][1]
+            else:
+                offset = to_ordinal(date) - view.origin
+            try:
+                r0[i] = self._get_rate_at(currency, offset, view)
+                r1[i] = self._get_rate_at(new_currency, offset, view)
+            except RateNotFoundError:
+                r0[i] = r1[i] = missing
+
+        if self.exact:
+            values = []
+            for amount, code in zip(amounts, codes):
+                if r0[code] is missing:
+                    values.append(None)
+                else:
+                    values.append(self._convert_exact(amount, r0[code], r1[code]))
+            return pd.Series(values, index=index, dtype=object)
+        if cast is float:
+            amounts = np.asarray(amounts, dtype=float)
+            r0, r1 = r0.astype(float), r1.astype(float)
+        else:
+            amounts = np.array([cast(amount) for amount in amounts], dtype=object)
+        return pd.Series(amounts / r0[codes] * r1[codes], index=index)
+
+    def convert_frame(
+        self, frame, new_currency="EUR", amount="amount", currency="currency", date=None
+    ):
+        """Convert the amounts of a pandas DataFrame.
+
+        See :meth:`convert_series`, the amounts, currencies and dates are
+        read from the columns of ``frame``.
+
+        :param str new_currency: The currency to convert to.
+        :param str amount: The column of the amounts.
+        :param str currency: The column of the currencies.
+        :param str date: The column of the dates, if None the most recent
+            rates are used.
+
+        :return: A Series of converted amounts, with the index of ``frame``.
+        """
+        dates = None if date is None else frame[date]
+        return self.convert_series(frame[amount], frame[currency], new_currency, dates)
+
+    def _get_offsets(self, view, currency, start_date, end_date):
+        """Get the offsets of a range of dates within the bounds of a currency."""
+        first, last = view.spans[currency]
+        offsets = []
+        for date, default in (start_date, first), (end_date, last):
+            offsets.append(default if date is None else to_ordinal(date) - view.origin)
+        start, end = offsets
+        if not first <= start <= end <= last:
+            first_date, last_date = view.bounds[currency]
+            raise RateNotFoundError(
+                f"{_offset_to_str(view, start)}/{_offset_to_str(view, end)} not in "
+                f"{currency} bounds {first_date}/{last_date}"
+            )
+        return start, end
+
+    def get_rates(self, currency, start_date=None, end_date=None):
+        """Get the rates of a currency for a range of dates.
+
+        The rates are not copied: this is a read-only view on the loaded
+        rates, with one rate per day, missing rates being NaN. Rates are
+        filled if ``fallback_on_missing_rate`` is set. With ``decimal``,
+        this is a tuple of rates, missing rates being None.
+
+        :param str currency: The currency to get the rates of.
+        :param datetime.date start_date: The first date included, default is
+            the first date available for the currency.
+        :param datetime.date end_date: The last date included, default is
+            the last date available for the currency.
+
+        >>> from datetime import date
+        >>> c = CurrencyConverter()
+        >>> c.get_rates('USD', date(2014, 3, 27), date(2014, 3, 28)).tolist()
+        [1.3758, 1.3759]
+        """
+        view = self._view
+        if currency not in view.currencies:
+            raise ValueError(f"{currency} is not a supported currency")
+        start, end = self._get_offsets(view, currency, start_date, end_date)
+
+        if currency == view.ref_currency:
+            if self.cast is Decimal:
+                return (self.cast("1"),) * (1 + end - start)
+            return memoryview(array("d", [1.0]) * (1 + end - start)).toreadonly()
+
+        rates, valid = view.column(currency)
+        if self.exact:
+            return tuple(
+                from_fixed_point(rate) if ok else None
+                for rate, ok in zip(rates[start : end + 1], valid[start : end + 1])
+            )
+        if isinstance(rates, array):
+            rates = memoryview(rates).toreadonly()
+        elif isinstance(rates, list):
+            rates = tuple(rates)
+        return rates[start : end + 1]
+
+    def average_rate(self, currency, start_date=None, end_date=None):
+        """Get the average rate of a currency over a range of dates.
+
+        Only the available rates are averaged, so filled rates are included
+        if ``fallback_on_missing_rate`` is set. Running sums of the rates are
+        computed the first time a currency is used, then averages over any
+        range, such as months or years, take constant time.
+
+        :param str currency: The currency to get the average rate of.
+        :param datetime.date start_date: The first date included, default is
+            the first date available for the currency.
+        :param datetime.date end_date: The last date included, default is
+            the last date available for the currency.
+
+        >>> from datetime import date
+        >>> c = CurrencyConverter()
+        >>> round(c.average_rate('USD', date(2014, 3, 27), date(2014, 3, 28)), 5)
+        1.37585
+        """
+        view = self._view
+        if currency not in view.currencies:
+            raise ValueError(f"{currency} is not a supported currency")
+        start, end = self._get_offsets(view, currency, start_date, end_date)
+        if currency == view.ref_currency:
+            return self.cast("1")
+
+        sums, errors, counts = view.prefix_sums(currency)
+        count = counts[end + 1] - counts[start]
+        if not count:
+            raise RateNotFoundError(
+                f"{currency} has no rate from {start_date} to {end_date}"
+            )
+        total = (sums[end + 1] - sums[start]) + (errors[end + 1] - errors[start])
+        if self.exact:
+            # Rates keep the precision of the context, like min and max rates
+            return _divide(total, count * _FIXED_POINT_SCALE, None, self.rounding)
+        return total / count
+
+    def min_rate(self, currency, start_date=None, end_date=None):
+        """Get the minimum rate of a currency over a range of dates.
+
+        This takes constant time, see :meth:`average_rate` for the parameters.
+        """
+        return self._get_extremum_rate(min, currency, start_date, end_date)
+
+    def max_rate(self, currency, start_date=None, end_date=None):
+        """Get the maximum rate of a currency over a range of dates.
+
+        This takes constant time, see :meth:`average_rate` for the parameters.
+        """
+        return self._get_extremum_rate(max, currency, start_date, end_date)
+
+    def _get_extremum_rate(self, func, currency, start_date, end_date):
+        view = self._view
+        if currency not in view.currencies:
+            raise ValueError(f"{currency} is not a supported currency")
+        start, end = self._get_offsets(view, currency, start_date, end_date)
+        if currency == view.ref_currency:
+            return self.cast("1")
+
+        # Two overlapping ranges of the same power of 2 cover the range
+        k = (1 + end - start).bit_length() - 1
+        level = view.sparse_table(currency, func)[k]
+        rate = func(level[start], level[end + 1 - 2**k])
+        if rate == _neutral(level, func):
+            raise RateNotFoundError(
+                f"{currency} has no rate from {start_date} to {end_date}"
+            )
+        return from_fixed_point(rate) if self.exact else rate
+
+    def cross_rates(self, date=None, currencies=None):
+        """Get the conversion rates between all pairs of currencies for a date.
+
+        The rate of each currency is looked up once, then the whole matrix is
+        computed from them. The last requested dates are kept in a cache.
+
+        :param datetime.date date: Use the conversion rates of this date. If
+            this is not given, the most recent rates are used.
+        :param currencies: The currencies of the matrix, default is all the
+            available currencies, sorted.
+
+        :return: A ``CrossRates(currencies, rates)`` named tuple, where
+            ``rates[i][j]`` is the value of 1 ``currencies[i]`` in
+            ``currencies[j]``, like ``convert(1, currencies[i], currencies[j])``.
+            Rates that are not available are NaN (None with ``decimal``).
+
+        >>> from datetime import date
+        >>> c = CurrencyConverter()
+        >>> x = c.cross_rates(date(2014, 3, 28), ['EUR', 'USD', 'BGN'])
+        >>> x.rates[0][1], x.rates[1][0]
+        (1.3759, 0.7267...)
+        """
+        view = self._view
+        if currencies is None:
+            currencies = sorted(view.currencies)
+        currencies = tuple(currencies)
+        for c in currencies:
+            if c not in view.currencies:
+                raise ValueError(f"{c} is not a supported currency")
+
+        if date is None:
+            offset = view.spans[view.ref_currency][1]
+        else:
+            offset = to_ordinal(date) - view.origin
+
+        key = offset, currencies
+        cross_rates = view.cross_rates.get(key)
+        if cross_rates is not None:
+            self._count("cross_rates.cached")
+            return cross_rates
+
+        missing = None if self.cast is Decimal else NAN
+        column = []
+        for c in currencies:
+            try:
+                column.append(self._get_rate_at(c, offset, view))
+            except RateNotFoundError:
+                column.append(missing)
+
+        rates = []
+        for r0 in column:
+            if r0 is missing or not r0:
+                rates.append((missing,) * len(column))
+            elif self.exact:  # rates are not rounded to ``places``
+                rounding = self.rounding
+                rates.append(
+                    tuple(
+                        None if r1 is None else _divide(r1, r0, None, rounding)
+                        for r1 in column
+                    )
+                )
+            elif missing is None:
+                inverse = self.cast(1) / r0
+                rates.append(
+                    tuple(None if r1 is None else inverse * r1 for r1 in column)
+                )
+            else:  # missing rates are NaN and stay NaN
+                inverse = 1 / r0
+                rates.append(tuple(inverse * r1 for r1 in column))
+
+        cross_rates = view.cross_rates[key] = CrossRates(currencies, tuple(rates))
+        return cross_rates
+
+
+def _is_single_value(values):
+    """Strings, dates and None are single values, not sequences."""
+    return values is None or isinstance(values, str) or not hasattr(values, "__len__")
+
+
+def _broadcast(values, n, name):
+    """Returns ``values`` as a sequence of ``n`` items.
+
+    Single values are repeated ``n`` times.
+    """
+    if _is_single_value(values):
+        return [values] * n
+    if len(values) != n:
+        raise ValueError(f"{name} has {len(values)} items, expected {n}")
+    return values
+
+
+class CurrencyPair:
+    """Converts amounts from a currency to another one, see
+    :meth:`CurrencyConverter.pair`.
+
+    Call it as ``pair(amount, date=None)``, with the same results and errors
+    as ``convert(amount, currency, new_currency, date)``. ``date`` can also
+    be a sequence of dates, or a NumPy array of ``datetime64``, to convert
+    amounts at each date: ``amount`` is then a single amount or a sequence of
+    amounts, and the converted amounts are returned as a list, or as an
+    ``array('d')`` (an array with NumPy dates).
+    """
+
+    def __init__(self, converter, currency, new_currency="EUR"):
+        view = converter._view
+        for c in currency, new_currency:
+            if c not in view.currencies:
+                raise ValueError(f"{c} is not a supported currency")
+
+        self.converter = converter
+        self.currency = currency
+        self.new_currency = new_currency
+        self._view = view
+        self._origin = view.origin
+        self._default = view.spans[currency][1]  # the most recent rate
+        self._cast = converter.cast
+        self._exact = converter.exact
+
+        # The reference currency has no column, it gets a constant one so
+        # that lookups need no branch
+        columns = []
+        for c in currency, new_currency:
+            if c == view.ref_currency:
+                first, last = view.spans[c]
+                column = _repeat(
+                    _new_column(0, converter._parse_rate),
+                    converter._ref_rate,
+                    last + 1,
+                )
+                columns.append((column, bytes([1]) * (last + 1)))
+            else:
+                columns.append(view.column(c))
+        (self._rates0, valid0), (self._rates1, valid1) = columns
+        self._first = max(view.spans[currency][0], view.spans[new_currency][0])
+        self._last = min(view.spans[currency][1], view.spans[new_currency][1])
+        self._valid = bytes(map(operator.and_, valid0, valid1))
+
+    def __repr__(self):
+        return f"<CurrencyPair {self.currency} -> {self.new_currency}>"
+
+    def __call__(self, amount, date=None):
+        if date is None:
+            offset = self._default
+        elif type(date) is int:
+            offset = date - self._origin
+        else:
+            try:
+                offset = date.toordinal() - self._origin
+            except AttributeError:
+                if not _is_single_value(date):
+                    return self._convert_many(amount, date)
+                offset = to_ordinal(date) - self._origin
+        if self._first <= offset <= self._last and self._valid[offset]:
+            if self._exact:
+                return self.converter._convert_exact(
+                    amount, self._rates0[offset], self._rates1[offset]
+                )
+            return self._cast(amount) / self._rates0[offset] * self._rates1[offset]
+        return self._convert_with_fallbacks(amount, offset)
+
+    def _convert_with_fallbacks(self, amount, offset):
+        """Convert like the converter does, for dates out of the fast path."""
+        converter, view = self.converter, self._view
+        r0 = converter._get_rate_at(self.currency, offset, view)
+        r1 = converter._get_rate_at(self.new_currency, offset, view)
+        if self._exact:
+            return converter._convert_exact(amount, r0, r1)
+        return self._cast(amount) / r0 * r1
+
+    def _convert_many(self, amounts, dates):
+        n = len(dates)
+        amounts = _broadcast(amounts, n, "amounts")
+        if getattr(dates, "dtype", None) is not None and dates.dtype.kind == "M":
+            return self._convert_datetime64(amounts, dates)
+        values = _new_column(n, self._cast)
+        for i, (amount, date) in enumerate(zip(amounts, dates)):
+            values[i] = self(amount, date)
+        return values
+
+    def _convert_datetime64(self, amounts, dates):
+        """Convert at NumPy dates, in bulk for the dates of the fast path."""
+        import numpy as np
+
+        dates = np.asarray(dates)
+        ordinals = dates.astype("datetime64[D]").astype(np.int64)
+        offsets = ordinals + (_UNIX_EPOCH_ORDINAL - self._origin)
+        offsets[np.isnat(dates)] = self._default
+        fast = (offsets >= self._first) & (offsets <= self._last)
+        fast[fast] = np.frombuffer(self._valid, dtype=np.uint8)[offsets[fast]] != 0
+
+        if self._cast is not float:
+            values = []
+            for amount, offset, ok in zip(amounts, offsets.tolist(), fast.tolist()):
+                if ok and self._exact:
+                    value = self.converter._convert_exact(
+                        amount, self._rates0[offset], self._rates1[offset]
+                    )
+                elif ok:
+                    value = self._cast(amount) / self._rates0[offset]
+                    value *= self._rates1[offset]
+                else:
+                    value = self._convert_with_fallbacks(amount, offset)
+                values.append(value)
+            return values
+
+        amounts = np.broadcast_to(np.asarray(amounts, dtype=float), offsets.shape)
+        values = np.empty(len(offsets))
+        rows = offsets[fast]
+        values[fast] = (
+            amounts[fast]
+            / np.frombuffer(self._rates0, dtype=float)[rows]
+            * np.frombuffer(self._rates1, dtype=float)[rows]
+        )
+        for i in np.flatnonzero(~fast).tolist():
+            values[i] = self._convert_with_fallbacks(amounts[i], int(offsets[i]))
+        return array("d", values.tobytes())
+
 
 class S3CurrencyConverter(CurrencyConverter):
     """
@@ -372,3 +2688,192 @@ class S3CurrencyConverter(CurrencyConverter):
     def load_file(self, currency_file):
         lines = currency_file.get_contents_as_string().splitlines()
         self.load_lines(lines)
+
+
+Conversion = namedtuple("Conversion", "amount sources")
+
+
+class FederatedCurrencyConverter(CurrencyConverter):
+    """
+    Combine the rates of several sources, such as the ECB data and other
+    feeds covering more currencies, into one table.
+
+    The sources are loaded concurrently, then each rate is taken from the
+    first source having it at this day, by priority. Lookups cost the same
+    as with one source, and the source of each rate is kept, see
+    :meth:`source_of` and :meth:`convert_with_sources`.
+
+    All sources must be in the same format, and oriented towards the same
+    ``ref_currency``.
+    """
+
+    def __init__(self, sources, priorities=None, **kwargs):
+        """Instantiate a FederatedCurrencyConverter.
+
+        :param sources: The sources, by priority: a dictionary of names to
+            ``currency_file``, or a list of ``currency_file`` used as names.
+        :param dict priorities: Source names by priority, for the currencies
+            using sources in another order. Sources that are not listed come
+            next, in their default order.
+        :param kwargs: The other options of :class:`CurrencyConverter`.
+        """
+        if kwargs.get("sparse"):
+            raise ValueError("sources cannot be combined with sparse rates")
+        if not isinstance(sources, dict):
+            sources = {currency_file: currency_file for currency_file in sources}
+        if not sources:
+            raise ValueError("no sources to load")
+        self.sources = sources
+        self.priorities = priorities or {}
+        self._origins = None
+        super().__init__(sources, **kwargs)
+
+    def load_file(self, sources):
+        from concurrent.futures import ThreadPoolExecutor
+
+        names = list(sources)
+        priorities = {}
+        for currency, order in self.priorities.items():
+            for name in order:
+                if name not in sources:
+                    raise ValueError(f"{name} is not a source")
+            priorities[currency] = [names.index(name) for name in order]
+
+        with self._timer("load"):
+            with ThreadPoolExecutor(len(names)) as executor:
+                loaded = executor.map(self._load_table, sources.values())
+                tables = [table for table, _, _ in loaded]
+
+            with self._timer("load.combine"):
+                table, origins = RateTable.combine(tables, priorities)
+            with self._timer("load.view"):
+                self._set_table(table)
+        self._origins = table.origin, names, origins
+        self._table_key = None
+        self._cache_file = None
+
+    def source_of(self, currency, date=None):
+        """Returns the name of the source of a rate, None for the reference
+        currency.
+
+        Missing rates filled by a fallback give the source of the previous
+        available rate, and dates out of the bounds the source of the rate
+        at the closest bound. Rates added by :meth:`apply_update` have no
+        source, None.
+
+        :param str currency: The currency of the rate.
+        :param datetime.date date: The date of the rate, default is the most
+            recent one.
+        """
+        view = self._view
+        if currency not in view.currencies:
+            raise ValueError(f"{currency} is not a supported currency")
+        if currency == view.ref_currency:
+            return None
+        origin, names, origins = self._origins
+        if currency not in origins:
+            return None  # the rates of the reference currency, once rebased
+
+        first, last = view.spans[currency]
+        if date is None:
+            offset = last
+        else:
+            offset = min(max(to_ordinal(date) - view.origin, first), last)
+        index = origins[currency]
+        offset += view.origin - origin
+        if not 0 <= offset < len(index):
+            return None  # added by an update
+        while offset > 0 and not index[offset]:
+            offset -= 1  # filled by a fallback
+        return names[index[offset] - 1] if index[offset] else None
+
+    def convert_with_sources(self, amount, currency, new_currency="EUR", date=None):
+        """Convert like :meth:`convert`, and report the sources of the rates.
+
+        :return: A ``Conversion(amount, sources)`` named tuple, where
+            ``sources`` has the sources of the rates of ``currency`` and
+            ``new_currency``, see :meth:`source_of`.
+        """
+        new_amount = self.convert(amount, currency, new_currency, date)
+        if date is None:
+            date = self._view.bounds[currency].last_date
+        sources = self.source_of(currency, date), self.source_of(new_currency, date)
+        return Conversion(new_amount, sources)
+
+
+class RefreshingCurrencyConverter(CurrencyConverter):
+    """
+    Reload the source data periodically, in a background thread.
+
+    The new rates are loaded aside and replace the current ones at once, so
+    conversions running meanwhile use either the old or the new rates, never
+    a mix of both, and never wait for the reload.
+    """
+
+    def __init__(self, currency_file=ECB_URL, refresh_interval=3600, **kwargs):
+        """Instantiate a RefreshingCurrencyConverter.
+
+        :param str currency_file: Path or URL of the source data, reloaded
+            at each refresh. Defaults to the ECB historical rates URL.
+        :param float refresh_interval: Seconds between two reloads.
+        :param kwargs: The other options of :class:`CurrencyConverter`.
+        """
+        self.currency_file = currency_file
+        self.refresh_interval = refresh_interval
+        self.last_refresh = None
+        self.last_refresh_error = None
+        super().__init__(currency_file, **kwargs)
+        self.last_refresh = datetime.datetime.now()
+        self._start()
+
+    def __getstate__(self):
+        state = super().__getstate__()
+        del state["_stopped"], state["_thread"]
+        return state
+
+    def __setstate__(self, state):
+        super().__setstate__(state)
+        self._start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _start(self):
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="currency-converter-refresh", daemon=True
+        )
+        self._thread.start()
+
+    def _run(self):
+        while not self._stopped.wait(self.refresh_interval):
+            self.refresh()
+
+    def refresh(self):
+        """Reload the source data now.
+
+        If loading fails, the current rates are kept and the error is stored
+        in ``last_refresh_error``.
+
+        :return: True if the rates were reloaded.
+        """
+        try:
+            self.load_file(self.currency_file)
+        except Exception as e:  # keep serving the current rates
+            self.last_refresh_error = e
+            self._count("refresh.error")
+            if self.verbose:
+                print(rf"/!\ could not refresh rates from {self.currency_file}: {e}")
+            return False
+        self.last_refresh = datetime.datetime.now()
+        self.last_refresh_error = None
+        return True
+
+    def stop(self):
+        """Stop the background refresh."""
+        self._stopped.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join()
@@ -0,0 +1,323 @@
+#!/usr/bin/env python
+"""
+A local HTTP service sharing one loaded converter between its clients.
+
+Start it with ``python -m currency_converter serve``, then::
+
+    GET  /convert?amount=100&currency=USD&to=EUR&date=2013-03-21
+    POST /convert?to=EUR            [{"amount": 100, "currency": "USD"}, ...]
+    GET  /cross_rates?date=2013-03-21&currencies=EUR,USD,JPY
+    GET  /stats                     with --stats, see CurrencyConverter.stats
+
+Replies are compact JSON, and connections are kept alive between requests.
+"""
+
+import os
+import sys
+import json
+import asyncio
+from http import HTTPStatus
+from urllib.parse import urlsplit, parse_qs
+
+from .currency_converter import (
+    CurrencyConverter,
+    RefreshingCurrencyConverter,
+    RateNotFoundError,
+    CURRENCY_FILE,
+    CACHE_DIR_ENV,
+    parse_date,
+)
+from .__main__ import FIELDS, convert_columns
+
+MAX_HEADERS = 100
+MAX_BODY_SIZE = 64 * 1024 * 1024
+KEEP_ALIVE_TIMEOUT = 60
+
+
+class HTTPError(Exception):
+    """An error replied to the client, with its HTTP status."""
+
+    def __init__(self, status, message=None):
+        super().__init__(message or status.phrase)
+        self.status = status
+
+
+def to_json(value):
+    """Compact JSON, where NaN becomes null and decimals become strings."""
+    return json.dumps(_replace_nan(value), separators=(",", ":"), default=str)
+
+
+def _replace_nan(value):
+    if isinstance(value, float):
+        return None if value != value else value
+    if isinstance(value, dict):
+        return {key: _replace_nan(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_replace_nan(item) for item in value]
+    return value
+
+
+class ConverterServer:
+    """Serve the conversions of one converter over HTTP."""
+
+    def __init__(self, converter):
+        self.converter = converter
+        self.routes = {
+            ("GET", "/convert"): self.convert,
+            ("POST", "/convert"): self.convert_batch,
+            ("GET", "/cross_rates"): self.cross_rates,
+            ("GET", "/stats"): self.stats,
+        }
+
+    async def start(self, host="127.0.0.1", port=8000):
+        """Start listening, returns the :class:`asyncio.Server`."""
+        return await asyncio.start_server(self.handle, host, port)
+
+    async def handle(self, reader, writer):
+        """Answer the requests of one connection, until it is closed."""
+        try:
+            while True:
+                try:
+                    request = await asyncio.wait_for(
+                        self.read_request(reader), KEEP_ALIVE_TIMEOUT
+                    )
+                except HTTPError as e:
+                    self.write_response(writer, e.status, {"error": str(e)}, True)
+                    break
+                if request is None:
+                    break
+                method, target, keep_alive, body = request
+                try:
+                    if body:  # batches run aside, not to stall the other clients
+                        payload = await asyncio.get_running_loop().run_in_executor(
+                            None, self.dispatch, method, target, body
+                        )
+                    else:
+                        payload = self.dispatch(method, target, body)
+                    status = HTTPStatus.OK
+                except HTTPError as e:
+                    status, payload = e.status, {"error": str(e)}
+                self.write_response(writer, status, payload, not keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        """Read a request, returns None if the connection was closed."""
+        line = await self.read_line(reader, HTTPStatus.REQUEST_URI_TOO_LONG)
+        if not line.strip():
+            return None
+        try:
+            method, target, version = line.decode("latin-1").split()
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "malformed request line") from None
+
+        headers = {}
+        too_large = HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE
+        while True:
+            line = await self.read_line(reader, too_large)
+            if line in (b"\r\n", b"\n", b""):
+                break
+            if len(headers) == MAX_HEADERS:
+                raise HTTPError(too_large)
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+
+        if "transfer-encoding" in headers:
+            raise HTTPError(HTTPStatus.NOT_IMPLEMENTED, "use a Content-Length")
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "invalid Content-Length") from None
+        if length > MAX_BODY_SIZE:
+            raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+        body = await reader.readexactly(length) if length else b""
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.0":
+            keep_alive = connection == "keep-alive"
+        else:
+            keep_alive = connection != "close"
+        return method, target, keep_alive, body
+
+    async def read_line(self, reader, status):
+        """Read a line, replying ``status`` if it is longer than the stream limit."""
+        try:
+            return await reader.readline()
+        except (ValueError, asyncio.LimitOverrunError):
+            raise HTTPError(status) from None
+
+    def write_response(self, writer, status, payload, close=False):
+        body = to_json(payload).encode()
+        head = (
+            f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+            "Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+        )
+        if close:
+            head += "Connection: close\r\n"
+        writer.write(head.encode() + b"\r\n" + body)
+
+    def dispatch(self, method, target, body):
+        """Call the handler of a request, returns the payload to reply."""
+        url = urlsplit(target)
+        try:
+            handler = self.routes[method, url.path]
+        except KeyError:
+            if any(path == url.path for _, path in self.routes):
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED) from None
+            raise HTTPError(HTTPStatus.NOT_FOUND) from None
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        try:
+            return handler(query, body)
+        except RateNotFoundError as e:
+            raise HTTPError(HTTPStatus.NOT_FOUND, str(e)) from None
+        except KeyError as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"missing {e}") from None
+        except (ArithmeticError, TypeError, ValueError) as e:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(e)) from None
+
+    def get_date(self, query):
+        date = query.get("date")
+        return None if date is None else parse_date(date)
+
+    def convert(self, query, body):
+        c = self.converter
+        amount = c.cast(query["amount"])
+        currency, new_currency = query["currency"], query.get("to", "EUR")
+        date = self.get_date(query)
+        if date is None and currency in c.currencies:
+            date = c.bounds[currency].last_date
+        new_amount = c.convert(amount, currency, new_currency, date)
+        return {
+            "amount": amount,
+            "currency": currency,
+            "to": new_currency,
+            "date": date,
+            "new_amount": new_amount,
+        }
+
+    def convert_batch(self, query, body):
+        rows = json.loads(body)
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise ValueError("expected a JSON array of objects")
+        columns = {name: [row.get(name) for row in rows] for name in FIELDS}
+        new_amounts = convert_columns(
+            self.converter, columns, query.get("to", "EUR"), self.get_date(query)
+        )
+        return {"new_amounts": new_amounts}
+
+    def cross_rates(self, query, body):
+        currencies = query.get("currencies")
+        if currencies is not None:
+            currencies = currencies.split(",")
+        date = self.get_date(query)
+        currencies, rates = self.converter.cross_rates(date, currencies)
+        return {"date": date, "currencies": currencies, "rates": rates}
+
+    def stats(self, query, body):
+        stats = self.converter.stats()
+        if stats is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, "stats are not collected")
+        timings = {name: timing._asdict() for name, timing in stats["timings"].items()}
+        return {"counters": stats["counters"], "timings": timings}
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="currency_converter serve")
+    parser.add_argument(
+        "--host",
+        help="address to listen on, default is %(default)s",
+        default="127.0.0.1",
+    )
+    parser.add_argument(
+        "-p",
+        "--port",
+        help="port to listen on, default is %(default)s",
+        type=int,
+        default=8000,
+    )
+    parser.add_argument(
+        "--decimal",
+        help="use decimal.Decimal internally",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--exact",
+        help="store rates as fixed-point integers, and round conversions once",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--sparse",
+        help="only store the available rates, and compute missing ones at lookup",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--currencies",
+        help="only load the rates of these comma-separated currencies",
+        type=lambda value: value.split(","),
+    )
+    parser.add_argument(
+        "-f",
+        "--file",
+        help="change currency file used, default is %(default)s",
+        default=CURRENCY_FILE,
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help=(
+            "keep a binary cache of the parsed currency file in this directory, "
+            f"default is ${CACHE_DIR_ENV} if set"
+        ),
+        default=os.environ.get(CACHE_DIR_ENV),
+    )
+    parser.add_argument(
+        "--stats",
+        help="count the conversions and fallbacks, and time the loads, see /stats",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--refresh-interval",
+        help="reload the currency file every REFRESH_INTERVAL seconds",
+        type=float,
+    )
+    args = parser.parse_args(argv)
+
+    kwargs = {
+        "fallback_on_wrong_date": True,
+        "fallback_on_missing_rate": True,
+        "decimal": args.decimal,
+        "exact": args.exact,
+        "sparse": args.sparse,
+        "currencies": args.currencies,
+        "cache_dir": args.cache_dir,
+        "collect_stats": args.stats,
+    }
+    if args.refresh_interval:
+        converter = RefreshingCurrencyConverter(
+            args.file, refresh_interval=args.refresh_interval, **kwargs
+        )
+    else:
+        converter = CurrencyConverter(args.file, **kwargs)
+
+    async def serve():
+        server = await ConverterServer(converter).start(args.host, args.port)
+        print(f"Serving on http://{args.host}:{args.port}", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,20 +1,53 @@
 #!/usr/bin/python
 
-from decimal import Decimal
+import asyncio
+import gc
+import glob
+import os
+import tempfile
+from bisect import bisect_left
+import http.client
+import json
+import mmap
+import pickle
+import random
+import threading
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from itertools import islice
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+from decimal import Decimal, ROUND_DOWN
 from datetime import datetime, date, timedelta
 from io import StringIO
+from fractions import Fraction
+from math import fsum
 
 import pytest
 from pytest import approx
+import currency_converter.currency_converter as cc
 from currency_converter import (
     CurrencyConverter,
     S3CurrencyConverter,
+    RefreshingCurrencyConverter,
+    FederatedCurrencyConverter,
     RateNotFoundError,
     ECB_URL,
     CURRENCY_FILE,
     SINGLE_DAY_ECB_URL,
     SINGLE_DAY_CURRENCY_FILE,
 )
+from currency_converter import benchmarks
+from currency_converter.__main__ import convert_stream, main, read_chunks
+from currency_converter.server import ConverterServer, to_json
+from currency_converter.currency_converter import (
+    get_lines_from_zip,
+    list_dates_between,
+    memoize,
+    parse_date,
+    to_ordinal,
+)
 
 c0 = CurrencyConverter()
 c1 = CurrencyConverter(fallback_on_missing_rate=True)
@@ -53,6 +86,11 @@ def decimal_converter():
     return CurrencyConverter(decimal=True)
 
 
+@pytest.fixture
+def exact_converter():
+    return CurrencyConverter(exact=True, fallback_on_missing_rate=True)
+
+
 HISTORY_CURRENCIES = {
     "HUF",
     "LVL",
@@ -146,6 +184,28 @@ class TestRates:
         assert c.convert(10, "EUR", "USD", datetime(2014, 3, 28)) == approx(13.758999)
         assert c.convert(10, "USD", "EUR", datetime(2014, 3, 28)) == approx(7.26797)
 
+    @pytest.mark.parametrize(
+        "day", [date(2014, 3, 28).toordinal(), "2014-03-28", datetime(2014, 3, 28, 9)]
+    )
+    def test_convert_with_other_dates(self, day):
+        assert c0.convert(10, "EUR", "USD", day) == c0.convert(
+            10, "EUR", "USD", date(2014, 3, 28)
+        )
+        assert c0.get_rates("USD", day, day)[0] == c0.convert(1, "EUR", "USD", day)
+        assert c0.cross_rates(day, ["EUR", "USD"]).rates[0][1] == 1.3759
+
+    def test_convert_with_datetime64(self):
+        np = pytest.importorskip("numpy")
+        day = np.datetime64("2014-03-28")
+        assert to_ordinal(day) == date(2014, 3, 28).toordinal()
+        assert c0.convert(10, "EUR", "USD", day) == approx(13.759)
+        with pytest.raises(ValueError):
+            to_ordinal(np.datetime64("NaT"))
+
+    def test_not_a_date(self):
+        with pytest.raises(TypeError):
+            c0.convert(10, "EUR", "USD", 2014.5)
+
     @pytest.mark.parametrize("c", converters)
     def test_convert_to_ref_currency(self, c):
         assert c.convert(10, "EUR") == 10.0
@@ -162,6 +222,765 @@ class TestRates:
         assert dc.convert(10, "EUR", "EUR") == Decimal(10)
 
 
+class TestConvertMany:
+    @pytest.mark.parametrize("c", converters)
+    def test_convert_many(self, c):
+        values, errors = c.convert_many(
+            [10, 10, 10, 10],
+            ["EUR", "EUR", "USD", "USD"],
+            ["USD", "USD", "EUR", "JPY"],
+            [date(2013, 3, 21), datetime(2014, 3, 28), date(2014, 3, 28), None],
+        )
+        assert not any(errors)
+        assert list(values[:3]) == approx([12.91, 13.758999, 7.26797])
+        assert values[3] == approx(c.convert(10, "USD", "JPY"))
+
+    def test_broadcast(self):
+        values, errors = c0.convert_many([10, 20], "EUR", "USD", date(2013, 3, 21))
+        assert list(values) == approx([12.91, 25.82])
+        assert list(errors) == [0, 0]
+
+    def test_wrong_length(self):
+        with pytest.raises(ValueError):
+            c0.convert_many([10, 20], ["EUR"], "USD")
+
+    def test_ordinals(self):
+        day = date(2013, 3, 21)
+        values, errors = c0.convert_many([10, 10], "EUR", "USD", [day.toordinal(), []])
+        assert list(errors) == [0, 1]
+        assert values[0] == c0.convert(10, "EUR", "USD", day)
+
+    @pytest.mark.parametrize("c", converters_without_missing_rate_fallback)
+    def test_errors_mask(self, c):
+        values, errors = c.convert_many(
+            [10, 10, 10],
+            ["AAA", "BGN", "EUR"],
+            "EUR",
+            [date(2013, 3, 21), date(2010, 11, 21), date(2013, 3, 21)],
+        )
+        assert list(errors) == [1, 1, 0]
+        assert values[0] != values[0]  # NaN
+        assert values[2] == 10
+
+    @pytest.mark.parametrize("c", converters_with_missing_rate_fallback)
+    def test_fallback_on_missing_rate(self, c):
+        values, errors = c.convert_many([10], ["BGN"], dates=[date(2010, 11, 21)])
+        assert list(errors) == [0]
+        assert values[0] == approx(c.convert(10, "BGN", date=date(2010, 11, 21)))
+
+    @pytest.mark.parametrize("c", converters)
+    def test_fallback_on_wrong_date(self, c):
+        values, errors = c.convert_many([10], "EUR", "USD", [date(1986, 2, 2)])
+        assert errors[0] == (c not in converters_with_wrong_date_fallback)
+
+    def test_decimal(self, decimal_converter):
+        values, errors = decimal_converter.convert_many(
+            [10, 10], ["EUR", "AAA"], "USD", date(2013, 3, 21)
+        )
+        assert values == [Decimal("12.910"), None]
+        assert list(errors) == [0, 1]
+
+
+class TestPair:
+    @pytest.mark.parametrize("c", converters)
+    @pytest.mark.parametrize(
+        "currencies", [("USD", "JPY"), ("EUR", "BGN"), ("CYP", "EUR"), ("EUR", "EUR")]
+    )
+    def test_same_as_convert(self, c, currencies):
+        pair = c.pair(*currencies)
+        for d in [None, date(1990, 1, 1), datetime(2014, 3, 28), date(2030, 1, 1)] + (
+            list_dates_between(date(2010, 11, 18), date(2010, 11, 30))
+        ):
+            try:
+                expected = c.convert(10, *currencies, d)
+            except RateNotFoundError:
+                with pytest.raises(RateNotFoundError):
+                    pair(10, d)
+            else:
+                assert pair(10, d) == expected
+
+    @pytest.mark.parametrize(
+        "kwargs", [{"decimal": True}, {"exact": True}, {"sparse": True}]
+    )
+    def test_modes(self, kwargs):
+        c = CurrencyConverter(fallback_on_missing_rate=True, **kwargs)
+        pair = c.pair("USD", "BGN")
+        for d in list_dates_between(date(2010, 11, 18), date(2010, 11, 30)):
+            assert pair(10, d) == c.convert(10, "USD", "BGN", d)
+
+    def test_unsupported_currency(self):
+        with pytest.raises(ValueError):
+            c0.pair("USD", "AAA")
+
+    def test_many_dates(self):
+        pair = c1.pair("USD", "JPY")
+        dates = [date(2013, 3, 21), None, datetime(2014, 3, 28)]
+        expected = [c1.convert(10, "USD", "JPY", d) for d in dates]
+        assert list(pair(10, dates)) == expected
+        assert list(pair([10, 20, 30], dates)) == [
+            expected[0],
+            2 * expected[1],
+            3 * expected[2],
+        ]
+        with pytest.raises(RateNotFoundError):
+            c0.pair("BGN")(10, [date(2010, 11, 21)])
+
+    def test_datetime64(self):
+        np = pytest.importorskip("numpy")
+        c = c3
+        pair = c.pair("USD", "JPY")
+        dates = np.array(["2010-11-19", "2010-11-21", "NaT", "1990-01-01"], "M8[D]")
+        values = pair(np.array([10, 20, 30, 40]), dates)
+        assert list(values) == [
+            c.convert(10, "USD", "JPY", date(2010, 11, 19)),
+            c.convert(20, "USD", "JPY", date(2010, 11, 21)),
+            c.convert(30, "USD", "JPY"),
+            c.convert(40, "USD", "JPY", date(1990, 1, 1)),
+        ]
+        values = c.pair("USD", "JPY")(10, dates.astype("M8[ns]")[:1])
+        assert list(values) == [c.convert(10, "USD", "JPY", date(2010, 11, 19))]
+
+
+class TestConvertSeries:
+    @pytest.fixture(autouse=True)
+    def pd(self):
+        return pytest.importorskip("pandas")
+
+    @pytest.mark.parametrize("c", converters)
+    def test_convert_series(self, pd, c):
+        amounts = pd.Series([10, 10, 10, 10], index=[3, 2, 1, 0])
+        dates = [date(2013, 3, 21), datetime(2014, 3, 28), date(2014, 3, 28), None]
+        values = c.convert_series(
+            amounts, ["EUR", "EUR", "USD", "USD"], ["USD", "USD", "EUR", "JPY"], dates
+        )
+        assert list(values.index) == [3, 2, 1, 0]
+        assert list(values) == [
+            c.convert(10, "EUR", "USD", dates[0]),
+            c.convert(10, "EUR", "USD", dates[1]),
+            c.convert(10, "USD", "EUR", dates[2]),
+            c.convert(10, "USD", "JPY"),
+        ]
+
+    def test_ordinals(self, pd):
+        d = date(2013, 3, 21)
+        expected = c0.convert(10, "EUR", "USD", d)
+        ordinals = pd.Series([d.toordinal(), d.toordinal() + 1])
+        values = c0.convert_series([10, 10], "EUR", "USD", ordinals)
+        next_day = c0.convert(10, "EUR", "USD", d + timedelta(days=1))
+        assert list(values) == [expected, next_day]
+        values = c0.convert_series([10], "EUR", "USD", [d.toordinal()])
+        assert list(values) == [expected]
+        values = c0.convert_series([10], "EUR", "USD", d.toordinal())
+        assert list(values) == [expected]
+
+    def test_convert_frame(self, pd):
+        frame = pd.DataFrame(
+            {
+                "amount": [10, 20, 30, 40],
+                "currency": ["EUR", "USD", "EUR", "AAA"],
+                "day": pd.to_datetime(["2013-03-21"] * 3 + ["2013-03-22"]),
+            }
+        )
+        values = c0.convert_frame(frame, "USD", date="day")
+        assert list(values[:3]) == approx([12.91, 20, 38.73])
+        assert values[3] != values[3]  # NaN
+
+    def test_distinct_rows(self, pd, monkeypatch):
+        calls = []
+        get_rate = c0._get_rate_at
+        monkeypatch.setattr(
+            c0, "_get_rate_at", lambda *args: calls.append(args) or get_rate(*args)
+        )
+        values = c0.convert_series(
+            pd.Series([10, 20] * 500),
+            pd.Series(["USD", "JPY"] * 500),
+            "EUR",
+            "2013-03-21",
+        )
+        assert len(calls) == 4
+        assert list(values[:2]) == approx([7.74593, 0.1626678])
+
+    @pytest.mark.parametrize("c", converters_without_missing_rate_fallback)
+    def test_missing_rates(self, pd, c):
+        values = c.convert_series(
+            [10, 10], ["BGN", "USD"], "EUR", [date(2010, 11, 21), date(1986, 2, 2)]
+        )
+        assert values.isna()[0]
+        assert values.isna()[1] == (c not in converters_with_wrong_date_fallback)
+
+    def test_wrong_length(self, pd):
+        with pytest.raises(ValueError):
+            c0.convert_series([10, 20], ["EUR"], "USD")
+
+    def test_decimal(self, pd, decimal_converter):
+        values = decimal_converter.convert_series(
+            [10, 10], ["EUR", "AAA"], "USD", date(2013, 3, 21)
+        )
+        assert values[0] == Decimal("12.910")
+        assert values.isna()[1]
+
+
+class TestCrossRates:
+    @pytest.mark.parametrize("c", converters)
+    def test_cross_rates(self, c):
+        d = date(2014, 3, 28)
+        x = c.cross_rates(d)
+        assert x.currencies == tuple(sorted(c.currencies))
+        i, j = x.currencies.index("USD"), x.currencies.index("JPY")
+        assert x.rates[i][j] == c.convert(1, "USD", "JPY", d)
+        assert x.rates[j][i] == c.convert(1, "JPY", "USD", d)
+        assert x.rates[i][i] == 1
+
+    def test_missing_rates(self):
+        x = c0.cross_rates(date(2010, 11, 21), ["EUR", "BGN"])
+        assert x.rates[0][0] == 1
+        assert all(r != r for r in (x.rates[0][1], x.rates[1][0], x.rates[1][1]))
+
+        x = c1.cross_rates(date(2010, 11, 21), ["EUR", "BGN"])
+        assert x.rates[1][0] == c1.convert(1, "BGN", "EUR", date(2010, 11, 21))
+
+    def test_cache(self):
+        c = CurrencyConverter()
+        x = c.cross_rates(date(2014, 3, 28), ["USD", "EUR"])
+        assert c.cross_rates(datetime(2014, 3, 28), ("USD", "EUR")) is x
+        assert c.cross_rates(date(2014, 3, 28), ["EUR", "USD"]) is not x
+        assert c._view.cross_rates.info().hits == 1
+
+    def test_unsupported_currency(self):
+        with pytest.raises(ValueError):
+            c0.cross_rates(currencies=["EUR", "AAA"])
+
+    def test_decimal(self, decimal_converter):
+        x = decimal_converter.cross_rates(date(2013, 3, 21), ["EUR", "USD", "CYP"])
+        assert x.rates[0][1] == Decimal("1.2910")
+        assert x.rates[0][2] is None and x.rates[2][0] is None
+
+
+class TestRanges:
+    def test_get_rates(self):
+        rates = c0.get_rates("USD", date(2014, 3, 27), datetime(2014, 3, 28))
+        assert rates.tolist() == [1.3758, 1.3759]
+        assert rates.readonly
+        column = c0._view.column("USD")[0]
+        assert rates.obj is getattr(column, "obj", column)  # no copy
+        assert len(c0.get_rates("USD")) == len(c0.get_rates("EUR"))
+
+    @pytest.mark.parametrize("c", [c0, c1])
+    def test_aggregates(self, c):
+        start, end = date(2010, 11, 1), date(2011, 3, 31)
+        rates = [r for r in c.get_rates("BGN", start, end).tolist() if r == r]
+        assert c.average_rate("BGN", start, end) == approx(fsum(rates) / len(rates))
+        assert c.min_rate("BGN", start, end) == min(rates)
+        assert c.max_rate("BGN", start, end) == max(rates)
+        assert c.min_rate("BGN", start, start) == c.max_rate("BGN", start, start)
+
+    def test_accuracy(self):
+        rates = [r for r in c0.get_rates("IDR").tolist() if r == r]
+        assert c0.average_rate("IDR") == approx(fsum(rates) / len(rates), rel=1e-15)
+
+    def test_missing_rates(self):
+        sunday = date(2010, 11, 21)
+        with pytest.raises(RateNotFoundError):
+            c0.average_rate("BGN", sunday, sunday)
+        with pytest.raises(RateNotFoundError):
+            c0.min_rate("BGN", sunday, sunday)
+        assert c1.min_rate("BGN", sunday, sunday) == approx(1.9558)
+
+    @pytest.mark.parametrize("method", ["get_rates", "average_rate", "max_rate"])
+    def test_out_of_bounds(self, method):
+        with pytest.raises(RateNotFoundError):
+            getattr(c0, method)("USD", date(1986, 2, 2), date(2014, 3, 28))
+        with pytest.raises(RateNotFoundError):
+            getattr(c0, method)("USD", date(2014, 3, 28), date(2014, 3, 27))
+        with pytest.raises(ValueError):
+            getattr(c0, method)("AAA")
+
+    def test_ref_currency(self):
+        assert c0.get_rates("EUR", date(2014, 3, 27), date(2014, 3, 28)).tolist() == [
+            1.0,
+            1.0,
+        ]
+        assert c0.average_rate("EUR") == c0.max_rate("EUR") == 1
+
+    def test_decimal(self, decimal_converter):
+        start, end = date(2014, 3, 27), date(2014, 3, 28)
+        rates = decimal_converter.get_rates("USD", start, end)
+        assert rates == (Decimal("1.3758"), Decimal("1.3759"))
+        assert decimal_converter.average_rate("USD", start, end) == Decimal("1.37585")
+        assert decimal_converter.max_rate("USD", start, end) == Decimal("1.3759")
+
+
+class TestExact:
+    def test_storage(self, exact_converter):
+        usd = exact_converter._view.table.rates["USD"]
+        assert usd.format == "q" and usd.readonly
+        offset = date(2014, 3, 28).toordinal() - exact_converter._view.table.origin
+        assert usd[offset] == 1375900
+
+    def test_rounded_once(self, exact_converter, decimal_converter):
+        amount, d = Decimal("100"), date(2013, 3, 21)
+        rates = [decimal_converter.convert(1, "EUR", u, d) for u in ("USD", "JPY")]
+        exact = Fraction(amount) / Fraction(rates[0]) * Fraction(rates[1])
+        new_amount = exact_converter.convert(amount, "USD", "JPY", d)
+        assert isinstance(new_amount, Decimal)
+        assert abs(Fraction(new_amount) - exact) <= Fraction(1, 10**24) * exact
+
+    def test_places(self):
+        c = CurrencyConverter(exact=True, places=2)
+        assert c.convert(100, "EUR", "USD", date(2013, 3, 21)) == Decimal("129.10")
+        assert c.convert(100, "USD", "EUR", date(2013, 3, 21)) == Decimal("77.46")
+        c = CurrencyConverter(exact=True, places=2, rounding=ROUND_DOWN)
+        assert c.convert(100, "USD", "EUR", date(2013, 3, 21)) == Decimal("77.45")
+
+    def test_same_rates_as_decimal(self, exact_converter, decimal_converter):
+        for d in date(2013, 3, 21), date(2000, 1, 3):
+            assert exact_converter.convert(1, "USD", date=d) == approx(
+                decimal_converter.convert(1, "USD", date=d)
+            )
+
+    def test_linear_interpolation(self):
+        c = CurrencyConverter(
+            exact=True, fallback_on_missing_rate=True, fallback_on_wrong_date=True
+        )
+        rate = c.convert(1, "EUR", "BGN", date(2010, 11, 21))
+        assert isinstance(rate, Decimal) and rate == approx(Decimal("1.9558"))
+
+    def test_too_many_decimals(self, tmp_path):
+        currency_file = tmp_path / "rates.csv"
+        currency_file.write_text("Date,USD,\n2014-03-28,1.37591234,\n")
+        with pytest.raises(ValueError):
+            CurrencyConverter(str(currency_file), exact=True)
+
+    def test_queries(self, exact_converter):
+        d = date(2013, 3, 21)
+        values, errors = exact_converter.convert_many(
+            [100, 100], "EUR", ["USD", "AAA"], d
+        )
+        assert values[0] == Decimal("129.1") and list(errors) == [0, 1]
+
+        currencies, rates = exact_converter.cross_rates(d, ["EUR", "USD"])
+        assert rates[0][1] == Decimal("1.291")
+
+        rates = exact_converter.get_rates("USD", d, d + timedelta(days=1))
+        assert rates == (Decimal("1.291"), Decimal("1.2948"))
+        average = exact_converter.average_rate("USD", d, d + timedelta(days=1))
+        assert average == Decimal("1.2929")
+        assert exact_converter.max_rate("USD", d, d + timedelta(days=1)) == Decimal(
+            "1.2948"
+        )
+
+    def test_queries_with_places(self):
+        c = CurrencyConverter(exact=True, places=2)
+        d = date(2013, 3, 21)
+        assert c.convert(100, "EUR", "USD", d) == Decimal("129.10")
+
+        # Rates are not rounded to the places of the amounts
+        currencies, rates = c.cross_rates(d, ["HUF", "EUR", "JPY", "USD"])
+        assert rates[0][1] == 1 / Decimal("305.42")
+        assert rates[2][3] == Decimal("1.291") / Decimal("122.95")
+        average = c.average_rate("USD", d, d + timedelta(days=1))
+        assert average == Decimal("1.2929")
+
+
+class TestSparse:
+    @pytest.mark.parametrize(
+        "method", ["linear_interpolation", "last_known", "nearest"]
+    )
+    def test_same_rates_as_dense(self, method):
+        kwargs = {
+            "fallback_on_missing_rate": True,
+            "fallback_on_missing_rate_method": method,
+            "fallback_on_wrong_date": True,
+        }
+        dense = CurrencyConverter(**kwargs)
+        sparse = CurrencyConverter(sparse=True, **kwargs)
+        assert sparse.bounds == dense.bounds
+        for currency in "USD", "BGN", "CYP", "ROL":
+            for d in list_dates_between(date(2010, 11, 18), date(2010, 11, 30)) + [
+                date(1990, 1, 1),
+                date(2030, 1, 1),
+            ]:
+                assert sparse.convert(1, "EUR", currency, d) == dense.convert(
+                    1, "EUR", currency, d
+                )
+        assert sparse.average_rate("BGN") == dense.average_rate("BGN")
+
+    def test_storage(self):
+        c = CurrencyConverter(sparse=True)
+        table = c._view.table
+        offsets = table.offsets["USD"]
+        assert len(offsets) == len(table.rates["USD"]) < table.size
+        assert list(offsets) == sorted(offsets)
+        offset = date(2014, 3, 28).toordinal() - table.origin
+        assert table.rates["USD"][bisect_left(offsets, offset)] == approx(1.3759)
+
+    def test_missing_rates(self):
+        c = CurrencyConverter(sparse=True)
+        with pytest.raises(RateNotFoundError):
+            c.convert(10, "BGN", date=date(2010, 11, 21))
+        assert c.convert(10, "EUR", "USD", date(2014, 3, 28)) == approx(13.759)
+
+    def test_exact(self):
+        c = CurrencyConverter(sparse=True, exact=True, fallback_on_missing_rate=True)
+        rate = c.convert(1, "EUR", "BGN", date(2010, 11, 21))
+        assert rate == CurrencyConverter(
+            exact=True, fallback_on_missing_rate=True
+        ).convert(1, "EUR", "BGN", date(2010, 11, 21))
+
+    def test_update(self):
+        c = CurrencyConverter(sparse=True)
+        c.apply_update(["Date,USD,", "2030-01-02,1.5,"])
+        assert c.bounds["USD"].last_date == date(2030, 1, 2)
+        assert c.convert(1, "EUR", "USD", date(2030, 1, 2)) == 1.5
+        assert c.convert(1, "EUR", "USD", date(2014, 3, 28)) == approx(1.3759)
+
+    def test_pickle_not_shared(self, tmp_path):
+        c = CurrencyConverter(sparse=True, cache_dir=str(tmp_path))
+        assert not list(tmp_path.iterdir())
+        with pytest.raises(TypeError):
+            c.share()
+        other = pickle.loads(pickle.dumps(c))
+        assert other.convert(10, "USD", date=date(2014, 3, 28)) == c.convert(
+            10, "USD", date=date(2014, 3, 28)
+        )
+
+
+class TestSelectedCurrencies:
+    @pytest.mark.parametrize(
+        "kwargs", [{}, {"sparse": True}, {"exact": True}, {"decimal": True}]
+    )
+    def test_same_rates_as_all(self, kwargs):
+        kwargs["fallback_on_missing_rate"] = True
+        full = CurrencyConverter(**kwargs)
+        c = CurrencyConverter(currencies=["USD", "BGN", "JPY"], **kwargs)
+        assert c.currencies == {"EUR", "USD", "BGN", "JPY"}
+        assert c.bounds == {
+            currency: full.bounds[currency] for currency in c.currencies
+        }
+        for d in list_dates_between(date(2010, 11, 18), date(2010, 11, 30)):
+            assert c.convert(10, "USD", "JPY", d) == full.convert(10, "USD", "JPY", d)
+            assert c.convert(10, "BGN", date=d) == full.convert(10, "BGN", date=d)
+
+    def test_other_currencies_not_loaded(self):
+        c = CurrencyConverter(currencies=["USD"])
+        assert set(c._view.table.rates) == {"USD"}
+        with pytest.raises(ValueError):
+            c.convert(10, "JPY")
+
+    def test_columns_not_parsed(self):
+        # Cells past the selected columns are never split nor read
+        lines = ["Date,USD,JPY,,", "2014-03-28,1.3759,not a rate,,", "2014-03-27,1.2,"]
+        c = CurrencyConverter(None, currencies=["USD"])
+        c.load_lines(lines)
+        assert c.currencies == {"EUR", "USD"}
+        assert c.convert(1, "EUR", "USD", date(2014, 3, 28)) == 1.3759
+
+    @pytest.mark.parametrize("currencies", [["XYZ"], ["USD", "XYZ", "AAA"]])
+    def test_unknown_currencies(self, currencies):
+        with pytest.raises(ValueError, match=r"^AAA, XYZ not in|^XYZ not in"):
+            CurrencyConverter(currencies=currencies)
+        assert CurrencyConverter(currencies=["EUR", "USD"]).currencies == {"EUR", "USD"}
+
+    @pytest.mark.parametrize("currencies", [[], ["EUR"]])
+    def test_no_source_currency(self, currencies):
+        with pytest.raises(ValueError, match="other than EUR"):
+            CurrencyConverter(currencies=currencies)
+
+    def test_single_currency(self):
+        c = CurrencyConverter(currencies="USD")
+        assert c.currencies == {"EUR", "USD"}
+
+    def test_update(self):
+        c = CurrencyConverter(currencies=["USD"])
+        c.apply_update(["Date,JPY,USD", "2030-01-02,150,1.5"])
+        assert c.currencies == {"EUR", "USD"}
+        assert c.convert(1, "EUR", "USD", date(2030, 1, 2)) == 1.5
+
+    def test_cache(self, tmp_path):
+        CurrencyConverter(currencies=["USD"], cache_dir=str(tmp_path))
+        CurrencyConverter(cache_dir=str(tmp_path))
+        assert len(list(tmp_path.glob("*.rates"))) == 2
+        c = CurrencyConverter(currencies=["USD"], cache_dir=str(tmp_path))
+        assert c.currencies == {"EUR", "USD"}
+
+
+class TestBase:
+    @staticmethod
+    def convert_or_none(c, *args):
+        try:
+            return c.convert(100, *args)
+        except RateNotFoundError:
+            return None
+
+    @pytest.mark.parametrize("base", ["USD", "CYP"])
+    @pytest.mark.parametrize(
+        "kwargs",
+        [
+            {},
+            {"fallback_on_missing_rate": True},
+            {
+                "fallback_on_missing_rate": True,
+                "fallback_on_missing_rate_method": "nearest",
+            },
+        ],
+    )
+    def test_same_as_two_hops(self, base, kwargs):
+        c = CurrencyConverter(**kwargs)
+        rebased = CurrencyConverter(base=base, **kwargs)
+        assert rebased._view.ref_currency == base
+        days = [
+            *list_dates_between(date(2010, 11, 18), date(2010, 11, 30)),
+            date(1999, 1, 1),  # before all the bounds
+            date(2000, 11, 26),  # before the bounds of BRL
+            date(2007, 12, 31),  # the last day of CYP and MTL
+            date(2008, 1, 2),
+            date(2021, 12, 25),  # after the bounds of CYP and MTL
+        ]
+        pairs = [
+            ("USD", "JPY"),
+            ("EUR", "USD"),
+            ("BGN", "GBP"),
+            ("BRL", "NOK"),
+            ("MTL", "USD"),
+            ("CYP", "MTL"),
+            ("EUR", "EUR"),
+        ]
+        for currencies in pairs:
+            for d in days:
+                expected = self.convert_or_none(c, *currencies, d)
+                if self.convert_or_none(c, base, "EUR", d) is None:
+                    expected = None  # base has no rate at this date
+                if expected is not None:
+                    assert rebased.convert(100, *currencies, d) == approx(expected)
+                elif set(currencies) <= rebased.currencies:
+                    with pytest.raises(RateNotFoundError):
+                        rebased.convert(100, *currencies, d)
+                else:  # BRL has no rate at the dates of CYP
+                    with pytest.raises(ValueError):
+                        rebased.convert(100, *currencies, d)
+        assert rebased.convert(100, base, base, date(2021, 12, 25)) == 100
+
+    def test_decimal(self, decimal_converter):
+        c = CurrencyConverter(base="USD", decimal=True)
+        d = date(2014, 3, 28)
+        assert c.convert(100, "USD", "EUR", d) == decimal_converter.convert(
+            100, "USD", "EUR", d
+        )
+
+    def test_intersected_bounds(self):
+        c = CurrencyConverter(base="CYP")
+        assert c.bounds["USD"] == c.bounds["CYP"] == c0.bounds["CYP"]
+        with pytest.raises(RateNotFoundError):
+            c.convert(100, "CYP", "USD", date(2014, 3, 28))
+
+    def test_no_common_rates(self):
+        c = CurrencyConverter(None, base="USD")
+        c.load_lines(["Date,USD,JPY", "2014-03-28,1.3,", "2014-03-27,,140"])
+        assert c.currencies == {"EUR", "USD"}
+
+    def test_update(self):
+        c = CurrencyConverter(base="USD")
+        c.apply_update(["Date,USD,JPY", "2030-01-02,2,300"])
+        assert c.convert(100, "USD", "JPY", date(2030, 1, 2)) == 15000
+        assert c.convert(100, "EUR", "USD", date(2030, 1, 2)) == 200
+
+        # The gap before the update, with its weekends, is filled like when
+        # loading the updated rates
+        lines = ["Date,USD,HUF", "2024-12-16,1.05,412.5"]
+        c = CurrencyConverter(base="USD", fallback_on_missing_rate=True)
+        c.apply_update(lines)
+        # Selected currencies, not to update the rates shared with other tests
+        full = CurrencyConverter(
+            fallback_on_missing_rate=True, currencies=["USD", "HUF"]
+        )
+        full.apply_update(lines)
+        for d in list_dates_between(date(2024, 12, 4), date(2024, 12, 16)):
+            assert c.convert(100, "HUF", "USD", d) == approx(
+                full.convert(100, "HUF", "USD", d), rel=1e-12
+            )
+        other = pickle.loads(pickle.dumps(c))
+        other.apply_update(["Date,USD,HUF", "2024-12-18,1.04,410"])
+        assert other.convert(100, "HUF", "USD", date(2024, 12, 15)) == approx(
+            c.convert(100, "HUF", "USD", date(2024, 12, 15)), rel=1e-12
+        )
+
+    def test_pickle(self):
+        c = CurrencyConverter(base="USD")
+        other = pickle.loads(pickle.dumps(c))
+        assert other.convert(100, "USD", "JPY") == c.convert(100, "USD", "JPY")
+        other = CurrencyConverter.attach(c.share(), base="USD")
+        assert other.convert(100, "USD", "JPY") == c.convert(100, "USD", "JPY")
+
+    def test_invalid(self):
+        with pytest.raises(ValueError):
+            CurrencyConverter(base="AAA")
+        with pytest.raises(ValueError):
+            CurrencyConverter(base="USD", exact=True)
+        with pytest.raises(ValueError):
+            CurrencyConverter(base="USD", fallback_on_wrong_date=True)
+        assert CurrencyConverter(base="EUR", fallback_on_wrong_date=True).base is None
+
+
+class TestFederated:
+    @pytest.fixture
+    def sources(self, tmp_path):
+        (tmp_path / "treasury.csv").write_text(
+            "Date,RUB,USD\n2024-12-04,110.5,1.05\n2024-12-03,111,\n"
+        )
+        (tmp_path / "cbr.csv").write_text("Date,RUB\n2024-12-04,109\n2024-12-02,108\n")
+        return {
+            "ecb": CURRENCY_FILE,
+            "treasury": str(tmp_path / "treasury.csv"),
+            "cbr": str(tmp_path / "cbr.csv"),
+        }
+
+    def test_priority(self, sources):
+        c = FederatedCurrencyConverter(sources)
+        assert c.currencies == c0.currencies | {"RUB"}
+        assert c.convert(100, "EUR", "RUB", date(2024, 12, 4)) == 11050
+        assert c.convert(100, "EUR", "RUB", date(2024, 12, 2)) == 10800
+        assert c.convert(100, "EUR", "USD", date(2024, 12, 4)) == c0.convert(
+            100, "EUR", "USD", date(2024, 12, 4)
+        )
+        assert c.bounds["USD"] == c0.bounds["USD"]
+
+    def test_currency_priorities(self, sources):
+        c = FederatedCurrencyConverter(sources, priorities={"RUB": ["cbr"]})
+        assert c.convert(100, "EUR", "RUB", date(2024, 12, 4)) == 10900
+        assert c.convert(100, "EUR", "RUB", date(2024, 12, 3)) == 11100
+        with pytest.raises(ValueError):
+            FederatedCurrencyConverter(sources, priorities={"RUB": ["boe"]})
+
+    def test_sources(self, sources):
+        c = FederatedCurrencyConverter(
+            sources, priorities={"RUB": ["cbr"]}, fallback_on_missing_rate=True
+        )
+        conversion = c.convert_with_sources(100, "RUB", "USD", date(2024, 12, 3))
+        assert conversion.amount == c.convert(100, "RUB", "USD", date(2024, 12, 3))
+        assert conversion.sources == ("treasury", "ecb")
+        assert c.convert_with_sources(100, "RUB").sources == ("cbr", None)
+        # Filled rates come from the source of the previous rate
+        assert c.source_of("USD", date(2014, 3, 29)) == "ecb"
+        c.apply_update(["Date,RUB", "2024-12-05,112"])
+        assert c.source_of("RUB", date(2024, 12, 5)) is None
+
+    def test_list_of_sources(self, sources):
+        c = FederatedCurrencyConverter([sources["cbr"], sources["treasury"]])
+        assert c.currencies == {"EUR", "RUB", "USD"}
+        assert c.source_of("RUB", date(2024, 12, 4)) == sources["cbr"]
+
+    def test_pickle(self, sources):
+        original = FederatedCurrencyConverter(sources)
+        c = pickle.loads(pickle.dumps(original))
+        assert c.convert_with_sources(100, "EUR", "RUB", date(2024, 12, 4)) == (
+            11050,
+            (None, "treasury"),
+        )
+
+
+class TestStats:
+    def test_disabled(self):
+        assert c0.stats() is None
+        assert "convert" not in vars(c0)
+        with pytest.raises(ValueError):
+            c0.add_stats_hook(print)
+
+    @pytest.mark.parametrize("sparse", [False, True])
+    def test_counters(self, sparse):
+        c = CurrencyConverter(
+            fallback_on_missing_rate=True,
+            fallback_on_wrong_date=True,
+            sparse=sparse,
+            collect_stats=True,
+        )
+        c.convert(10, "USD", date=date(2013, 3, 21))
+        c.convert(10, "USD", date=date(2013, 3, 23))  # a Saturday
+        c.convert(10, "USD", date=date(1990, 1, 1))
+        c.convert_many([1, 2], "USD", "JPY", [date(2013, 3, 21)] * 2)
+        # Fallbacks are counted once per distinct lookup, not per row
+        c.convert_many([1, 2], "USD", "JPY", [date(2013, 3, 23)] * 2)
+        c.cross_rates(date(2013, 3, 21), ["EUR", "USD"])
+        c.cross_rates(date(2013, 3, 21), ["EUR", "USD"])
+        # Pairs fill missing rates in their columns, without counting them
+        pair = c.pair("USD", "JPY")
+        for _ in range(5):
+            pair(10, date(2013, 3, 23))
+
+        stats = c.stats()
+        counters = stats["counters"]
+        assert counters["convert"] == 3
+        assert counters["convert_many"] == 2
+        assert counters["convert_many.rows"] == 4
+        assert counters["cross_rates"] == 2
+        assert counters["cross_rates.cached"] == 1
+        assert counters["pair"] == 1
+        assert counters["fallback.missing_rate"] == 3
+        assert counters["fallback.wrong_date"] == 1
+        assert "rate_not_found" not in counters
+        assert ("fill" in stats["timings"]) is not sparse
+
+        c.reset_stats()
+        assert c.stats() == {"counters": {}, "timings": {}}
+
+    def test_errors(self):
+        c = CurrencyConverter(collect_stats=True)
+        with pytest.raises(RateNotFoundError):
+            c.convert(10, "BGN", date=date(2010, 11, 21))
+        with pytest.raises(RateNotFoundError):
+            c.convert(10, "USD", date=date(1990, 1, 1))
+        values, errors = c.convert_many([1], "USD", dates=[date(2013, 3, 23)])
+        assert list(errors) == [1]
+        assert c.stats()["counters"]["rate_not_found"] == 3
+
+    def test_load_timings(self, tmp_path):
+        source = tmp_path / "rates.csv"
+        source.write_text("Date,USD\n2013-03-21,1.291\n2013-03-19,1.2935\n")
+        c = CurrencyConverter(str(source), cache_dir=str(tmp_path), collect_stats=True)
+        stats = c.stats()
+        assert stats["counters"] == {"table.parsed": 1}
+        for name in "load", "load.hash", "load.parse", "load.cache_write", "load.view":
+            timing = stats["timings"][name]
+            assert timing.count == 1 and timing.total == timing.max >= 0
+
+        c.load_file(str(source))
+        assert c.stats()["counters"]["table.shared"] == 1
+        cc._shared_tables.pop(c._table_key)
+        c.load_file(str(source))
+        stats = c.stats()
+        assert stats["counters"]["table.cached"] == 1
+        assert stats["timings"]["load"].count == 3
+
+        c.apply_update(["Date,USD", "2013-03-22,1.3"])
+        assert c.stats()["timings"]["update"].count == 1
+
+    def test_hooks(self):
+        events = []
+        c = CurrencyConverter(fallback_on_wrong_date=True, collect_stats=True)
+        c.add_stats_hook(lambda name, value: events.append((name, value)))
+        c.convert(10, "USD", date=date(1990, 1, 1))
+        assert events == [("convert", 1), ("fallback.wrong_date", 1)]
+        c.load_file(CURRENCY_FILE)
+        assert events[-1][0] == "load" and events[-1][1] >= 0
+
+    def test_refresh_error(self, tmp_path):
+        source = tmp_path / "rates.csv"
+        source.write_text("Date,USD\n2013-03-21,1.291\n")
+        with RefreshingCurrencyConverter(str(source), collect_stats=True) as c:
+            source.unlink()
+            assert not c.refresh()
+        assert c.stats()["counters"]["refresh.error"] == 1
+
+    def test_pickle(self):
+        c = CurrencyConverter(collect_stats=True)
+        c.add_stats_hook(lambda name, value: None)  # not picklable
+        c.convert(10, "USD")
+        copy = pickle.loads(pickle.dumps(c))
+        assert copy.stats() == {"counters": {}, "timings": {}}
+        copy.convert(10, "USD")
+        assert copy.stats()["counters"] == {"convert": 1}
+        assert c.stats()["counters"]["convert"] == 1
+
+
 class TestErrorCases:
     @pytest.mark.parametrize("c", converters)
     def test_wrong_currency(self, c):
@@ -194,11 +1013,58 @@ class TestErrorCases:
         assert li.convert(10, "USD", date=date(2019, 12, 8)) == approx(9.02418)
         assert ln.convert(10, "USD", date=date(2019, 12, 8)) == approx(9.01388)
 
+    def test_fallback_nearest(self):
+        c = CurrencyConverter(
+            fallback_on_missing_rate=True, fallback_on_missing_rate_method="nearest"
+        )
+        # Sunday is closer to Monday, Saturday to Friday
+        monday = c.convert(10, "USD", date=date(2019, 12, 9))
+        friday = c.convert(10, "USD", date=date(2019, 12, 6))
+        assert c.convert(10, "USD", date=date(2019, 12, 8)) == monday
+        assert c.convert(10, "USD", date=date(2019, 12, 7)) == friday
+
+    def test_unknown_fallback_method(self):
+        with pytest.raises(ValueError):
+            CurrencyConverter(
+                fallback_on_missing_rate=True, fallback_on_missing_rate_method="foo"
+            )
+
 
 def last_n_days(n):
     return [date.today() - timedelta(days=d) for d in reversed(range(n + 1))]
 
 
+class TestMemoize:
+    def test_bounded(self):
+        calls = []
+
+        @memoize(maxsize=2)
+        def square(x):
+            calls.append(x)
+            return x * x
+
+        assert [square(x) for x in (1, 2, 1, 3, 2)] == [1, 4, 1, 9, 4]
+        # 2 was evicted by 3, as 1 was used more recently
+        assert calls == [1, 2, 3, 2]
+        assert square.cache_info() == (1, 4, 2, 2)
+
+        square.cache_clear()
+        assert square.cache_info() == (0, 0, 2, 0)
+
+    def test_parse_date(self):
+        parse_date.cache_clear()
+        assert parse_date("2014-03-28") == date(2014, 3, 28)
+        assert parse_date("2014-03-28") == date(2014, 3, 28)
+        assert parse_date("28 March 2014") == date(2014, 3, 28)
+        assert parse_date.cache_info() == (1, 2, 4096, 2)
+
+    def test_list_dates_between(self):
+        dates = list_dates_between(date(2014, 3, 28), date(2014, 4, 2))
+        assert len(dates) == 6
+        assert list_dates_between(date(2014, 3, 28), date(2014, 4, 2)) is dates
+        assert list_dates_between.cache_info().maxsize == 32
+
+
 class TestAttributes:
     @pytest.mark.parametrize("c", converters)
     def test_bounds(self, c):
@@ -245,6 +1111,17 @@ class TestCustomObject:
         assert self.c.convert(10, "EUR", "USD", date(2012, 1, 1)) == approx(180)
         assert self.c.convert(10, "USD", "EUR", date(2012, 1, 1)) == approx(0.55555555)
 
+    def test_fallback_nearest(self):
+        c = CurrencyConverter(
+            currency_file=None,
+            fallback_on_missing_rate=True,
+            fallback_on_missing_rate_method="nearest",
+        )
+        c.load_lines(["Date,USD", "2014-03-27,6", "2014-03-23,18"])
+        # Ties use the previous rate
+        rates = [c._get_rate("USD", date(2014, 3, d)) for d in range(23, 28)]
+        assert rates == [18, 18, 18, 6, 6]
+
     def test_fallback_rate(self):
         # Fallback rate is the average between 2 and 6, so 4
         assert self.c.convert(10, "EUR", "USD", date(2014, 3, 28)) == approx(40)
@@ -264,6 +1141,583 @@ class TestCustomObject:
         }
 
 
+class TestStorage:
+    def test_columns(self):
+        table = c0._view.table
+        usd = table.rates["USD"]
+        assert usd.format == "d" and usd.readonly
+        assert len(usd) == len(table.valid["USD"]) == table.size
+        assert table.origin == date(1999, 1, 4).toordinal()
+
+        offset = date(2014, 3, 28).toordinal() - table.origin
+        assert table.valid["USD"][offset] == 1
+        assert usd[offset] == approx(1.3759)
+
+        # Missing rates are masked, and only filled with a fallback method
+        offset = date(2010, 11, 21).toordinal() - table.origin
+        assert table.valid["BGN"][offset] == 0
+        assert c0._view.column("BGN")[1][offset] == 0
+        assert c1._view.column("BGN")[1][offset] == 1
+
+    def test_rows_in_any_order(self):
+        lines = list(get_lines_from_zip(open(CURRENCY_FILE, "rb").read()))
+        table = cc.RateTable.from_lines(lines)
+        rows = lines[1:]
+        random.Random(0).shuffle(rows)
+        for other in lines[:1] + lines[:0:-1], lines[:1] + rows:
+            other = cc.RateTable.from_lines(other)
+            assert (other.origin, other.size) == (table.origin, table.size)
+            assert other.valid == table.valid
+            assert all(
+                other.rates[u].tobytes() == table.rates[u].tobytes()
+                for u in table.rates
+            )
+
+    def test_repeated_dates(self):
+        table = cc.RateTable.from_lines(
+            ["Date,USD,JPY", "2014-03-28,1.3759,N/A", "2014-03-28,1.38,140.9"]
+        )
+        assert table.rates["USD"][0] == 1.38 and table.rates["JPY"][0] == 140.9
+        assert table.size == 1
+
+    @pytest.mark.parametrize("jobs", [1, 2])
+    def test_chunks(self, jobs):
+        lines = list(get_lines_from_zip(open(CURRENCY_FILE, "rb")))
+        # The same days in several chunks, with some rates missing at the end
+        for line in lines[1:30]:
+            day, _, *rates = line.split(",")
+            lines.append(",".join([day, "N/A", *rates]))
+        expected = cc.RateTable.from_lines(lines, cast=cc.to_fixed_point)
+        table = cc.RateTable.from_chunks(
+            lines,
+            cast=cc.to_fixed_point,
+            parallel_threshold=2000,
+            chunk_size=1000,
+            jobs=jobs,
+        )
+        assert (table.origin, table.size) == (expected.origin, expected.size)
+        assert table.valid == expected.valid
+        assert {c: list(r) for c, r in table.rates.items()} == {
+            c: list(r) for c, r in expected.rates.items()
+        }
+
+    def test_many_chunks(self):
+        lines = list(islice(get_lines_from_zip(open(CURRENCY_FILE, "rb")), 301))
+        expected = cc.RateTable.from_lines(lines, cast=cc.to_fixed_point)
+        table = cc.RateTable.from_chunks(lines, cast=cc.to_fixed_point, chunk_size=1)
+        assert table.valid == expected.valid
+        assert table.rates == expected.rates  # integers, without NaN
+        tables = [expected] * 256
+        assert cc.RateTable.combine(tables, with_origins=False)[0].valid == table.valid
+        with pytest.raises(ValueError):
+            cc.RateTable.combine(tables)
+
+    def test_parallel_threshold(self, monkeypatch):
+        monkeypatch.setattr(cc, "_shared_tables", weakref.WeakValueDictionary())
+        for threshold in None, 0:
+            c = CurrencyConverter(parallel_threshold=threshold)
+            assert c._view.table.valid == c0._view.table.valid
+        with pytest.raises(ValueError):
+            cc.RateTable.from_chunks(["Date,USD"])
+
+    def test_streamed_source(self, tmp_path):
+        with open(CURRENCY_FILE, "rb") as f:
+            lines = get_lines_from_zip(f)
+            assert next(lines).startswith("Date,USD,JPY,")
+        source = tmp_path / "history.csv"
+        source.write_text("\n".join(get_lines_from_zip(open(CURRENCY_FILE, "rb"))))
+        c = CurrencyConverter(str(source))
+        assert c._view.table.valid == c0._view.table.valid
+
+    def test_decimal_columns(self, decimal_converter):
+        assert isinstance(decimal_converter._view.table.rates["USD"], tuple)
+
+    def test_shared_table(self):
+        assert all(c._view.table is c0._view.table for c in converters)
+
+        # Only filled columns are private to a converter
+        assert c0._view.column("BGN")[0] is c0._view.table.rates["BGN"]
+        assert c1._view.column("BGN")[0] is not c1._view.table.rates["BGN"]
+        assert c1._view.column("BGN") is not c4._view.column("BGN")
+
+    def test_unshared_options(self, decimal_converter):
+        assert decimal_converter._view.table is not c0._view.table
+        c = CurrencyConverter(na_values={"", "N/A", "0"})
+        assert c._view.table is not c0._view.table
+
+
+class TestCache:
+    @pytest.fixture(autouse=True)
+    def unshared_tables(self, monkeypatch):
+        # Otherwise converters reuse the tables of the module converters
+        monkeypatch.setattr(cc, "_shared_tables", weakref.WeakValueDictionary())
+
+    def test_cache_roundtrip(self, tmp_path):
+        c = CurrencyConverter(fallback_on_missing_rate=True, cache_dir=str(tmp_path))
+        assert not isinstance(c._view.table.rates["USD"].obj, mmap.mmap)
+        assert len(list(tmp_path.glob("*.rates"))) == 1
+
+        cc._shared_tables.clear()
+        cached = CurrencyConverter(
+            fallback_on_missing_rate=True, cache_dir=str(tmp_path)
+        )
+        assert isinstance(cached._view.table.rates["USD"].obj, mmap.mmap)
+        assert cached.currencies == c.currencies
+        assert cached.bounds == c.bounds
+        for d in date(2010, 11, 21), date(2014, 3, 28):
+            assert cached.convert(10, "BGN", "USD", d) == c.convert(10, "BGN", "USD", d)
+
+    def test_cache_shared_by_fallback_options(self, tmp_path):
+        CurrencyConverter(cache_dir=str(tmp_path))
+        cc._shared_tables.clear()
+        CurrencyConverter(fallback_on_missing_rate=True, cache_dir=str(tmp_path))
+        assert len(list(tmp_path.glob("*.rates"))) == 1
+
+        cc._shared_tables.clear()
+        with pytest.raises(RateNotFoundError):
+            CurrencyConverter(cache_dir=str(tmp_path)).convert(
+                10, "BGN", date=date(2010, 11, 21)
+            )
+
+    def test_invalid_cache_file(self, tmp_path):
+        CurrencyConverter(cache_dir=str(tmp_path))
+        (cache_file,) = tmp_path.glob("*.rates")
+        cache_file.write_bytes(b"garbage")
+
+        cc._shared_tables.clear()
+        c = CurrencyConverter(cache_dir=str(tmp_path))
+        assert not isinstance(c._view.table.rates["USD"].obj, mmap.mmap)
+        assert c.convert(10, "EUR", "USD", date(2013, 3, 21)) == approx(12.91)
+
+        # The unreadable file was replaced by a valid one
+        assert cc.read_cache(str(cache_file)).rates.keys() == c._view.table.rates.keys()
+
+    def test_cache_roundtrip_exact(self, tmp_path):
+        c = CurrencyConverter(exact=True, cache_dir=str(tmp_path))
+        cc._shared_tables.clear()
+        cached = CurrencyConverter(exact=True, cache_dir=str(tmp_path))
+        assert isinstance(cached._view.table.rates["USD"].obj, mmap.mmap)
+        assert cached._view.table.rates["USD"].format == "q"
+        d = date(2013, 3, 21)
+        assert cached.convert(10, "USD", "JPY", d) == c.convert(10, "USD", "JPY", d)
+
+    def test_no_cache_with_decimal(self, tmp_path):
+        CurrencyConverter(decimal=True, cache_dir=str(tmp_path))
+        assert not list(tmp_path.iterdir())
+
+
+def convert_in_worker(c):
+    mapped = isinstance(c._view.table.rates["USD"].obj, mmap.mmap)
+    return mapped, c.convert(10, "BGN", "USD", date(2010, 11, 21))
+
+
+class TestSharing:
+    def test_attach(self):
+        c = CurrencyConverter.attach(c1.share(), fallback_on_missing_rate=True)
+        assert isinstance(c._view.table.rates["USD"].obj, mmap.mmap)
+        assert c.bounds == c1.bounds
+        assert c.convert(10, "BGN", date=date(2010, 11, 21)) == approx(5.112997238)
+        assert c1.share() == c.share()
+
+    def test_pickle_sends_a_handle(self):
+        c3.share()
+        data = pickle.dumps(c3)
+        assert len(data) < 1000
+        c = pickle.loads(data)
+        assert isinstance(c._view.table.rates["USD"].obj, mmap.mmap)
+        assert c.fallback_on_missing_rate_method == "linear_interpolation"
+        assert c.convert(10, "BGN", date=date(2010, 11, 21)) == approx(5.112997238)
+
+    def test_pickle_by_value(self):
+        original = CurrencyConverter(
+            fallback_on_missing_rate=True, currencies=["USD", "BGN", "JPY"]
+        )
+        data = pickle.dumps(original)
+        del original
+        gc.collect()
+        c = pickle.loads(data)
+        assert not isinstance(c._view.table.rates["USD"].obj, mmap.mmap)
+        assert c.convert(10, "BGN", date=date(2010, 11, 21)) == approx(5.112997238)
+
+    def test_share_failure_leaves_no_file(self, monkeypatch):
+        def fail(cache_file, table):
+            raise OSError("disk full")
+
+        shm_dir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+        pattern = os.path.join(shm_dir, "currency_converter-*.rates")
+        before = set(glob.glob(pattern))
+        c = CurrencyConverter(currencies=["USD", "BGN", "CHF"])
+        monkeypatch.setattr(cc, "write_cache", fail)
+        with pytest.raises(OSError):
+            c.share()
+        assert set(glob.glob(pattern)) == before
+
+    def test_pickle_decimal(self, decimal_converter):
+        c = pickle.loads(pickle.dumps(decimal_converter))
+        assert c.convert(10, "EUR", "USD", date(2013, 3, 21)) == Decimal("12.910")
+
+    def test_process_pool(self):
+        c1.share()
+        c3.share()
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            results = list(executor.map(convert_in_worker, [c1, c3]))
+        for (mapped, value), c in zip(results, [c1, c3]):
+            assert mapped
+            assert value == c.convert(10, "BGN", "USD", date(2010, 11, 21))
+
+
+BATCH_CSV = """\
+id,amount,currency,date
+1,10,USD,2013-03-21
+2,10,AAA,2013-03-21
+3,10,USD,
+"a ""quoted""
+field",10,EUR,not a date
+4,10,EUR,2013-03-21
+"""
+
+
+class TestBatch:
+    def test_csv(self):
+        output = StringIO()
+        convert_stream(c0, StringIO(BATCH_CSV), output, new_currency="JPY")
+        lines = output.getvalue().splitlines()
+        assert lines[0] == "id,amount,currency,date,new_amount"
+        assert (
+            lines[1]
+            == f"1,10,USD,2013-03-21,{c0.convert(10, 'USD', 'JPY', date(2013, 3, 21))}"
+        )
+        assert lines[2] == "2,10,AAA,2013-03-21,"
+        assert lines[3] == f"3,10,USD,,{c0.convert(10, 'USD', 'JPY')}"
+        assert lines[5] == 'field",10,EUR,not a date,'
+        assert lines[6] == "4,10,EUR,2013-03-21,1229.5"
+
+    @pytest.mark.parametrize("options", [{"chunk_size": 1}, {"jobs": 2}])
+    def test_chunks(self, options):
+        expected, output = StringIO(), StringIO()
+        convert_stream(c1, StringIO(BATCH_CSV), expected, new_currency="JPY")
+        convert_stream(c1, StringIO(BATCH_CSV), output, new_currency="JPY", **options)
+        assert output.getvalue() == expected.getvalue()
+
+    def test_read_chunks(self):
+        lines = StringIO(BATCH_CSV).readlines()
+        chunks = list(read_chunks(lines[1:], 4, quoted=True))
+        assert [len(chunk) for chunk in chunks] == [5, 1]
+
+    def test_jsonl(self, decimal_converter):
+        source = StringIO(
+            '{"amount": 10, "currency": "EUR", "date": "2013-03-21", "to": "USD"}\n'
+            "\n"
+            '{"amount": 10, "currency": "AAA"}\n'
+        )
+        output = StringIO()
+        convert_stream(decimal_converter, source, output, fmt="jsonl")
+        assert output.getvalue() == (
+            '{"amount": 10, "currency": "EUR", "date": "2013-03-21", "to": "USD", '
+            '"new_amount": "12.910"}\n'
+            '{"amount": 10, "currency": "AAA", "new_amount": null}\n'
+        )
+
+    def test_main(self, tmp_path, monkeypatch, capsys):
+        path = tmp_path / "rows.csv"
+        path.write_text(BATCH_CSV)
+        monkeypatch.setattr(
+            "sys.argv", ["currency_converter", "--batch", str(path), "-t", "EUR"]
+        )
+        assert main() == 0
+        assert capsys.readouterr().out.splitlines()[-1] == "4,10,EUR,2013-03-21,10.0"
+
+    def test_missing_fields(self, tmp_path, monkeypatch, capsys):
+        with pytest.raises(ValueError, match="no currency field"):
+            convert_stream(c0, StringIO("id,amount\n1,10\n"), StringIO())
+        path = tmp_path / "rows.csv"
+        path.write_text("id,value\n1,10\n")
+        monkeypatch.setattr("sys.argv", ["currency_converter", "--batch", str(path)])
+        assert main() == 1
+        output = capsys.readouterr()
+        assert output.out == ""
+        assert "no amount nor currency field" in output.err
+
+    def test_main_requires_amount(self, monkeypatch):
+        monkeypatch.setattr("sys.argv", ["currency_converter"])
+        with pytest.raises(SystemExit):
+            main()
+
+
+@pytest.fixture(scope="class")
+def server_port():
+    loop = asyncio.new_event_loop()
+    server = loop.run_until_complete(ConverterServer(c3).start("127.0.0.1", 0))
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    yield server.sockets[0].getsockname()[1]
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join()
+    server.close()
+    loop.close()
+
+
+class TestServer:
+    @pytest.fixture
+    def request_json(self, server_port):
+        connection = http.client.HTTPConnection("127.0.0.1", server_port, timeout=10)
+
+        def request_json(method, url, body=None):
+            connection.request(method, url, body=body)
+            response = connection.getresponse()
+            return response.status, json.loads(response.read())
+
+        yield request_json
+        connection.close()
+
+    def test_convert(self, request_json):
+        status, data = request_json(
+            "GET", "/convert?amount=10&currency=USD&to=JPY&date=2013-03-21"
+        )
+        assert status == 200
+        assert data == {
+            "amount": 10,
+            "currency": "USD",
+            "to": "JPY",
+            "date": "2013-03-21",
+            "new_amount": c3.convert(10, "USD", "JPY", date(2013, 3, 21)),
+        }
+        status, data = request_json("GET", "/convert?amount=10&currency=USD")
+        assert data["date"] == str(c3.bounds["USD"].last_date)
+
+    def test_keep_alive(self, request_json):
+        for _ in range(3):
+            status, _ = request_json("GET", "/convert?amount=10&currency=USD")
+            assert status == 200
+
+    def test_batch(self, request_json):
+        rows = [
+            {"amount": 10, "currency": "EUR", "date": "2013-03-21"},
+            {"amount": 10, "currency": "AAA"},
+            {"amount": 10, "currency": "EUR", "to": "EUR"},
+        ]
+        status, data = request_json("POST", "/convert?to=USD", json.dumps(rows))
+        assert status == 200
+        assert data == {"new_amounts": [approx(12.91), None, 10]}
+
+    def test_cross_rates(self, request_json):
+        status, data = request_json(
+            "GET", "/cross_rates?date=2013-03-21&currencies=EUR,USD"
+        )
+        assert status == 200
+        assert data["currencies"] == ["EUR", "USD"]
+        assert data["rates"][0] == [1, 1.291]
+
+    @pytest.mark.parametrize(
+        "method, url, body, status",
+        [
+            ("GET", "/convert?amount=10&currency=AAA", None, 400),
+            ("GET", "/convert?amount=x&currency=USD", None, 400),
+            ("GET", "/convert?currency=USD", None, 400),
+            ("POST", "/convert", "{}", 400),
+            ("GET", "/unknown", None, 404),
+            ("PUT", "/convert", None, 405),
+            ("GET", "/stats", None, 404),
+        ],
+    )
+    def test_errors(self, request_json, method, url, body, status):
+        response_status, data = request_json(method, url, body)
+        assert response_status == status
+        assert "error" in data
+
+    @pytest.mark.parametrize(
+        "url, headers, status",
+        [
+            ("/convert?" + "x" * 70000, {}, 414),
+            ("/convert", {"X-Long": "x" * 70000}, 431),
+        ],
+    )
+    def test_too_long(self, server_port, url, headers, status):
+        connection = http.client.HTTPConnection("127.0.0.1", server_port, timeout=10)
+        connection.request("GET", url, headers=headers)
+        response = connection.getresponse()
+        assert response.status == status
+        assert "error" in json.loads(response.read())
+        connection.close()
+
+    def test_stats(self):
+        c = CurrencyConverter(collect_stats=True)
+        c.convert(10, "USD")
+        data = json.loads(to_json(ConverterServer(c).stats({}, b"")))
+        assert data["counters"]["convert"] == 1
+        assert set(data["timings"]["load"]) == {"count", "total", "max"}
+
+
+class TestBenchmarks:
+    def test_synthetic_history(self):
+        lines = benchmarks.synthetic_history(years=1, currencies=30)
+        assert lines[0].startswith("Date,XAA,XAB,") and 260 <= len(lines) <= 262
+        assert lines == benchmarks.synthetic_history(years=1, currencies=30)
+        c = CurrencyConverter(None, exact=True)
+        c.load_lines(lines)
+        assert len(c.currencies) == 31
+        assert c.bounds["XBD"].last_date < date.today()
+
+    def test_run(self):
+        results = benchmarks.run_benchmarks(
+            repeat=1, rows=100, calls=100, years=1, currencies=3, bundled=False
+        )
+        assert results["synthetic.load.zip"][1] == "s"
+        assert results["synthetic.convert_many"][1] == "rows/s"
+        assert results["synthetic.memory.float"][0] > 0
+        document = json.loads(json.dumps(benchmarks.to_json(results)))
+        assert benchmarks.from_json(document) == results
+
+    def test_compare(self):
+        baseline = {"load": (1.0, "s"), "many": (100, "rows/s"), "gone": (1, "B")}
+        results = {"load": (0.5, "s"), "many": (50, "rows/s"), "new": (1, "B")}
+        assert benchmarks.compare(results, baseline) == [
+            ("load", 1.0, 0.5, -0.5, False),
+            ("many", 100, 50, 0.5, True),
+        ]
+        assert not any(r[-1] for r in benchmarks.compare(results, baseline, 1))
+
+
+class TestUpdate:
+    def test_apply_update(self):
+        c = CurrencyConverter(
+            currency_file=None, fallback_on_wrong_date=True, fallback_on_missing_rate=True
+        )
+        c.load_lines(["Date,USD,AAA", "2014-03-22,N/A,0", "2014-03-23,18,N/A"])
+        assert c.convert(10, "EUR", "USD", date(2014, 3, 26)) == approx(180)
+
+        c.apply_update(["Date,USD,AAA", "2014-03-29,2,N/A", "2014-03-27,6,0"])
+        assert c.bounds == TestCustomObject.c.bounds
+        for d in range(22, 30):
+            assert c.convert(10, "EUR", "USD", date(2014, 3, d)) == approx(
+                TestCustomObject.c.convert(10, "EUR", "USD", date(2014, 3, d))
+            )
+
+    def test_replace_rates(self):
+        c = CurrencyConverter(currency_file=None, fallback_on_missing_rate=True)
+        c.load_lines(["Date,USD", "2014-03-21,1", "2014-03-24,4", "2014-03-25,5"])
+        assert c.convert(1, "EUR", "USD", date(2014, 3, 23)) == approx(3)
+
+        c.apply_update(["Date,USD", "2014-03-24,7"])
+        assert c.convert(1, "EUR", "USD", date(2014, 3, 23)) == approx(5)
+        assert c.convert(1, "EUR", "USD", date(2014, 3, 25)) == approx(5)
+
+    def test_single_day_update(self):
+        c = CurrencyConverter(fallback_on_missing_rate=True)
+        c.convert(10, "BGN", date=date(2010, 11, 21))  # fill a column
+        c.apply_update(SINGLE_DAY_CURRENCY_FILE)
+        assert c.bounds == c1.bounds
+        assert c.convert(10, "BGN", date=date(2010, 11, 21)) == approx(5.112997238)
+        assert c.convert(10, "USD") == c1.convert(10, "USD")
+
+        # Other converters sharing the table are not affected
+        assert c._view.table is not c1._view.table
+
+    def test_update_cache(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(cc, "_shared_tables", weakref.WeakValueDictionary())
+        source = tmp_path / "history.csv"
+        lines = list(get_lines_from_zip(open(CURRENCY_FILE, "rb").read()))
+        source.write_text("\n".join(lines[:1] + lines[2:]))  # without last day
+
+        c = CurrencyConverter(str(source), cache_dir=str(tmp_path))
+        last_date = c.bounds["USD"].last_date
+        c.apply_update(SINGLE_DAY_CURRENCY_FILE)
+        assert c.bounds["USD"].last_date > last_date
+
+        cc._shared_tables.clear()
+        cached = CurrencyConverter(str(source), cache_dir=str(tmp_path))
+        assert isinstance(cached._view.table.rates["USD"].obj, mmap.mmap)
+        assert cached.bounds == c.bounds
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def http_dir(tmp_path):
+    """Serve tmp_path over HTTP, yields (directory, base URL)."""
+    handler = partial(QuietHandler, directory=str(tmp_path))
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield tmp_path, f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+class TestRefresh:
+    def test_refresh_from_url(self, http_dir):
+        directory, url = http_dir
+        (directory / "rates.csv").write_text("Date,USD\n2014-03-21,2\n")
+
+        with RefreshingCurrencyConverter(
+            f"{url}/rates.csv", refresh_interval=0.05
+        ) as c:
+            assert c.convert(10, "EUR", "USD") == approx(20)
+
+            (directory / "rates.csv").write_text("Date,USD\n2014-03-25,4\n")
+            wait_for(lambda: c.bounds["USD"].last_date == date(2014, 3, 25))
+            assert c.convert(10, "EUR", "USD") == approx(40)
+            assert c.last_refresh_error is None
+
+    def test_refresh_error_keeps_rates(self, tmp_path):
+        source = tmp_path / "rates.csv"
+        source.write_text("Date,USD\n2014-03-21,2\n")
+
+        with RefreshingCurrencyConverter(str(source)) as c:
+            source.unlink()
+            assert not c.refresh()
+            assert isinstance(c.last_refresh_error, OSError)
+            assert c.convert(10, "EUR", "USD") == approx(20)
+
+    def test_consistent_snapshots(self, tmp_path):
+        # Mixing bounds of one version with rates of the other would fail
+        versions = [
+            "Date,USD\n2014-03-21,2\n",
+            "Date,USD\n2014-03-25,4\n2014-03-24,4\n",
+        ]
+        source = tmp_path / "rates.csv"
+        source.write_text(versions[0])
+        results = set()
+        errors = []
+
+        def convert_loop(c, stop):
+            while not stop.is_set():
+                try:
+                    results.add(c.convert(10, "EUR", "USD"))
+                except Exception as e:
+                    errors.append(e)
+
+        with RefreshingCurrencyConverter(str(source)) as c:
+            stop = threading.Event()
+            thread = threading.Thread(target=convert_loop, args=(c, stop))
+            thread.start()
+            for i in range(100):
+                source.write_text(versions[i % 2])
+                c.refresh()
+            stop.set()
+            thread.join()
+
+        assert not errors
+        assert results and results <= {20, 40}
+
+    def test_stop(self, tmp_path):
+        source = tmp_path / "rates.csv"
+        source.write_text("Date,USD\n2014-03-21,2\n")
+        c = RefreshingCurrencyConverter(str(source), refresh_interval=0.01)
+        c.stop()
+        assert not c._thread.is_alive()
+
+
 @pytest.mark.parametrize(
     "c",
     [